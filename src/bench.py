@@ -0,0 +1,317 @@
+"""Benchmarks of the game hot paths, run it from the src folder like main.py
+
+	python bench.py                  runs every benchmark and compares it with bench_baseline.json
+	python bench.py --save           runs them and saves the results as the new baseline
+	python bench.py zombies convert  only runs the benchmarks with these names in them
+
+Every benchmark is seeded so it does the same work on every run, the result is ops/sec (best of a few rounds)
+and the memory one op allocates (the tracemalloc peak while it runs) plus the memory it keeps (leaks/caches).
+The exit code is 1 if a benchmark got slower or allocates more than the baseline allows, ops/sec depend on the machine
+so save the baseline on the machine the comparison runs on"""
+import argparse
+import asyncio
+import inspect
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+import storage
+import replay
+from render import BoardRenderer
+from mazes import CompiledMaze
+from engine import UP, DOWN, LEFT, RIGHT, directions, storyline_mazes, Bullet, Zombie, ZombiesState, SpaceshooterState, MazeState, SpeedState, summon_blocks, convert, check_zombie_collides, tick, step_speed
+import main # format_board/format_speed_board, importing it doesn't start the bot
+
+here = os.path.dirname(os.path.abspath(__file__))
+databases = [] # the temporary databases of the score benchmarks, deleted once every benchmark ran
+benchmarks = {} # name -> setup, setup returns the op to time (a function or a coroutine function)
+seed = 2022
+
+
+def bench(name):
+	def decorator(setup):
+		benchmarks[name] = setup
+		return setup
+	return decorator
+
+def recorded_boards(state, frames, inputs):
+	"""Plays a game with random inputs and returns a copy of every board it showed"""
+	boards = []
+	for _ in range(frames):
+		if state.over:
+			state = type(state)(seed=random.getrandbits(32))
+		tick(state, [random.choice(inputs)] if random.random() < 0.3 else [])
+		boards.append([list(row) for row in state.render()])
+	return boards
+
+def cycle(items):
+	"""An op argument that changes every op, without the cost of random calls in the timed loop"""
+	index = -1
+	count = len(items)
+	def next_item():
+		nonlocal index
+		index = (index + 1) % count
+		return items[index]
+	return next_item
+
+
+@bench('format_board')
+def format_board():
+	"""The board of a zombies game every tick, one renderer per game so the rows that didn't change are reused"""
+	boards = cycle(recorded_boards(ZombiesState(seed=seed), 500, directions))
+	view = BoardRenderer()
+	return lambda: view.render(boards())
+
+@bench('format_board_cold')
+def format_board_cold():
+	"""A board nobody rendered before, what the one off boards and the first frame of a game cost"""
+	boards = cycle(recorded_boards(ZombiesState(seed=seed), 500, directions))
+	return lambda: BoardRenderer().render(boards())
+
+@bench('format_speed_board')
+def format_speed_board():
+	"""A 5x5 board and its circles, the way the speed command passes them"""
+	boards = cycle([SpeedState([1], seed=random.getrandbits(32)) for _ in range(500)])
+	def op():
+		state = boards()
+		return main.format_speed_board(state.board, state.blocks)
+	return op
+
+@bench('go_direction')
+def go_direction():
+	"""A maze move, the biggest storyline maze is compiled once and every op looks up one (cell, direction)"""
+	state = MazeState(storyline_mazes[-1])
+	cells = [(x, y) for x, row in enumerate(state.board) for y, tile in enumerate(row) if tile in ' p']
+	moves = cycle([(random.choice(cells), random.choice([UP, DOWN, LEFT, RIGHT])) for _ in range(1000)])
+	compiled = state.compiled
+	return lambda: compiled.move(*moves())
+
+@bench('compile_maze')
+def compile_maze():
+	"""Loading a maze, every move of it is worked out here"""
+	mazes = cycle(storyline_mazes)
+	return lambda: CompiledMaze([list(line) for line in mazes().split('\n')])
+
+@bench('check_zombie_collides')
+def collides():
+	"""A full board, 5 bullets and 5 zombies around the middle so some of them meet"""
+	near = lambda: [random.randint(3, 7), random.randint(3, 7)]
+	ticks = []
+	for _ in range(500):
+		bullets = [Bullet(random.choice(directions), near()) for _ in range(5)]
+		zombies = [Zombie(random.choice(directions)) for _ in range(5)]
+		for zombie in zombies:
+			zombie.index = near()
+		ticks.append((bullets, zombies))
+	ticks = cycle(ticks)
+	def op():
+		bullets, zombies = ticks()
+		return check_zombie_collides(bullets[:], zombies[:]) # copies, it removes the ones that met
+	return op
+
+@bench('convert')
+def convert_coordinates():
+	"""A speed answer, mostly valid coordinates in both orders and some junk"""
+	tokens = [f'{letter}{digit}' for letter in 'abcde' for digit in range(1, 6)] + [f'{digit}{letter}' for letter in 'abcde' for digit in range(1, 6)] + ['z9', 'aa', '11', 'a10', 'hello']
+	messages = cycle([' '.join(random.choices(tokens, k=random.randint(1, 8))) for _ in range(500)])
+	return lambda: list(convert(messages()))
+
+@bench('summon_blocks')
+def summon():
+	return lambda: summon_blocks([['g']*5 for _ in range(5)])
+
+def speed_round(size):
+	"""A round of speed: scoring an answer, the next circles and the frame"""
+	state = SpeedState([1], size=size, seed=seed)
+	letters = 'abcdefghij'
+	def op():
+		step_speed(state, (1, ' '.join(f'{letters[y]}{x+1}' for x, y in state.blocks)))
+		return main.format_speed_board(state.render(), state.blocks)
+	return op
+
+@bench('speed_round')
+def speed_round_5():
+	return speed_round(5)
+
+@bench('speed_round_10x10')
+def speed_round_10():
+	"""Should cost about the same as the 5x5 round"""
+	return speed_round(10)
+
+def game_tick(state_type, inputs, chance):
+	"""One tick of a real time game like the command runs it: the inputs since the last tick, the step and the board of the next frame"""
+	state = state_type(seed=seed)
+	view = BoardRenderer()
+	def op():
+		nonlocal state
+		if state.over:
+			state = state_type(seed=random.getrandbits(32))
+		tick(state, [random.choice(inputs)] if random.random() < chance else [])
+		return view.render(state.render())
+	return op
+
+@bench('zombies_tick')
+def zombies_tick():
+	return game_tick(ZombiesState, directions, 0.3)
+
+@bench('spaceshooter_tick')
+def spaceshooter_tick():
+	return game_tick(SpaceshooterState, [LEFT, RIGHT], 0.5)
+
+@bench('verify_replay')
+def verify_replay():
+	"""Playing a recorded spaceshooter game again and checking its score, what replay.py does for every replay"""
+	state = SpaceshooterState(seed=seed)
+	recorder = replay.Recorder(state, seed)
+	while not state.over:
+		inputs = [random.choice([LEFT, RIGHT])] if random.random() < 0.5 else []
+		recorder.tick(inputs)
+		tick(state, inputs)
+	log = recorder.finish()
+	return lambda: replay.verify(log)
+
+async def score_store(players=1000):
+	"""A ScoreStore on a temporary database that already has the zombies scores of players"""
+	directory = tempfile.mkdtemp()
+	db = await storage.aiosqlite.connect(os.path.join(directory, 'scores.db'))
+	databases.append((db, directory))
+	scores = storage.ScoreStore(db)
+	await scores.setup()
+	for player in range(players):
+		scores.save(player, 'zombies', random.randint(0, 500))
+	await scores.flush()
+	return scores
+
+@bench('save_score')
+async def save_score():
+	"""What main.save_score does at the end of a game: queue the score and update the cached top scores"""
+	scores = await score_store()
+	await scores.leaderboard('zombies')
+	players = cycle([(random.randint(0, 2000), random.randint(0, 600)) for _ in range(1000)])
+	def op():
+		player, score = players()
+		scores.save(player, 'zombies', score)
+	return op
+
+@bench('flush_scores')
+async def flush_scores():
+	"""Writing a batch of 100 queued scores in one transaction"""
+	scores = await score_store()
+	batches = cycle([[(random.randint(0, 2000), random.randint(0, 600)) for _ in range(100)] for _ in range(50)])
+	async def op():
+		for player, score in batches():
+			scores.save(player, 'zombies', score)
+		await scores.flush()
+	return op
+
+@bench('leaderboard')
+async def leaderboard():
+	"""The leaderboard of a game that was asked for before, only the data_version check reaches the database"""
+	scores = await score_store()
+	await scores.leaderboard('zombies')
+	return lambda: scores.leaderboard('zombies')
+
+@bench('leaderboard_cold')
+async def leaderboard_cold():
+	"""The first leaderboard of a game (or the first one after another process saved scores), the top is read from the database"""
+	scores = await score_store()
+	async def op():
+		scores.fresh.clear()
+		return await scores.leaderboard('zombies')
+	return op
+
+
+async def timed(op, count, is_async):
+	"""Runs op count times and returns the seconds it took"""
+	if is_async:
+		start = time.perf_counter()
+		for _ in range(count):
+			await op()
+	else:
+		start = time.perf_counter()
+		for _ in range(count):
+			op()
+	return time.perf_counter() - start
+
+async def allocations(op, count, is_async):
+	"""Returns (peak, kept): the most memory one op had allocated at once and the memory the ops didn't free, in bytes per op"""
+	tracemalloc.start()
+	start, _ = tracemalloc.get_traced_memory()
+	peaks = 0
+	for _ in range(count):
+		before, _ = tracemalloc.get_traced_memory()
+		tracemalloc.reset_peak()
+		if is_async:
+			await op()
+		else:
+			op()
+		peaks += tracemalloc.get_traced_memory()[1] - before
+	end, _ = tracemalloc.get_traced_memory()
+	tracemalloc.stop()
+	return peaks//count, max(end-start, 0)//count
+
+async def run(name, rounds=5, target=0.2):
+	"""Times a benchmark, every round runs long enough to take about target seconds"""
+	random.seed(seed)
+	setup = benchmarks[name]
+	op = await setup() if inspect.iscoroutinefunction(setup) else setup()
+	is_async = inspect.isawaitable(first := op())
+	if is_async:
+		await first
+	await timed(op, 10, is_async) # warm up, the first ops fill the caches
+	count = 10
+	while (elapsed := await timed(op, count, is_async)) < target/10:
+		count *= 10
+	count = max(int(count*target/elapsed), 1)
+	best = min([await timed(op, count, is_async) for _ in range(rounds)])
+	peak, kept = await allocations(op, min(count, 1000), is_async)
+	return {'ops': round(count/best, 1), 'peak': peak, 'kept': kept}
+
+def compare(result, baseline, tolerance):
+	"""Returns why result is a regression against baseline, None if it isn't"""
+	if result['ops'] < baseline['ops']*(1-tolerance):
+		return f"{(1-result['ops']/baseline['ops'])*100:.0f}% slower"
+	if result['peak'] > baseline['peak']*(1+tolerance) + 64: # a few bytes more is noise (dict resizes, interned strings)
+		return f"allocates {result['peak']-baseline['peak']} B more per op"
+	return None
+
+async def main_async(args):
+	path = os.path.join(here, args.baseline)
+	baseline = {}
+	if os.path.exists(path):
+		with open(path, 'r') as f:
+			baseline = json.load(f)
+	names = [name for name in benchmarks if not args.names or any(part in name for part in args.names)]
+	results = {}
+	regressions = 0
+	print(f"{'benchmark':<26}{'ops/sec':>14}{'baseline':>14}{'peak B/op':>12}{'kept B/op':>12}")
+	for name in names:
+		result = results[name] = await run(name)
+		old = baseline.get(name)
+		problem = compare(result, old, args.tolerance) if old else None
+		regressions += problem is not None
+		was = f"{old['ops']:,.0f}" if old else '-'
+		print(f"{name:<26}{result['ops']:>14,.0f}{was:>14}{result['peak']:>12,}{result['kept']:>12,}" + (f'  REGRESSION: {problem}' if problem else ''))
+	for db, directory in databases:
+		await db.close()
+		shutil.rmtree(directory)
+	if args.save:
+		with open(path, 'w') as f:
+			json.dump({**baseline, **results}, f, indent='\t')
+		print(f'Saved the baseline to {args.baseline}')
+	return 1 if regressions and not args.save else 0
+
+def main_cli():
+	parser = argparse.ArgumentParser(description='Benchmarks of the game hot paths')
+	parser.add_argument('names', nargs='*', help='only run the benchmarks with one of these in their name')
+	parser.add_argument('--save', action='store_true', help='save the results as the new baseline')
+	parser.add_argument('--baseline', default='bench_baseline.json')
+	parser.add_argument('--tolerance', type=float, default=0.25, help='how much slower/bigger than the baseline is still fine, 0.25 is 25%%')
+	sys.exit(asyncio.run(main_async(parser.parse_args())))
+
+if __name__ == '__main__':
+	main_cli()
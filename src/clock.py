@@ -0,0 +1,35 @@
+"""The clock of the real time games, one timer wakes every game that waits for the same tick instead of every game sleeping on its own"""
+import asyncio
+
+
+class TickClock:
+	"""Timer wheel with a fixed tick length, a game sleeps a number of ticks and every game due on a tick is woken by one wakeup"""
+	def __init__(self, tick=0.5):
+		self.tick = tick # seconds per tick, game speeds are rounded to it
+		self.now = 0 # ticks since the clock started
+		self.wheel = {} # tick -> futures of the games waiting for it
+		self.task = None
+
+	async def sleep(self, seconds):
+		"""Waits until the tick that's seconds away, at least one tick"""
+		future = asyncio.get_event_loop().create_future()
+		self.wheel.setdefault(self.now + max(1, round(seconds/self.tick)), []).append(future)
+		if self.task is None:
+			self.task = asyncio.get_event_loop().create_task(self.run())
+		await future
+
+	async def run(self):
+		"""Ticks while games are waiting, stops once nobody is"""
+		loop = asyncio.get_event_loop()
+		start = loop.time() - self.now*self.tick
+		try:
+			while self.wheel:
+				delay = start + (self.now+1)*self.tick - loop.time()
+				if delay > 0:
+					await asyncio.sleep(delay)
+				self.now += 1
+				for future in self.wheel.pop(self.now, ()):
+					if not future.done(): # cancelled games leave their future behind
+						future.set_result(None)
+		finally:
+			self.task = None
@@ -0,0 +1,48 @@
+"""Collision detection shared by the games, every entity has an index (its cell) and a direction (how it moved this tick)"""
+
+
+def cell(entity):
+	return (entity.index[0], entity.index[1])
+
+def previous_cell(entity):
+	"""The cell the entity was in before it moved this tick"""
+	return (entity.index[0]-entity.direction[0], entity.index[1]-entity.direction[1])
+
+class CellIndex:
+	"""Cell -> entities lookup, built once per tick so finding what's on a cell doesn't need to scan every entity"""
+	def __init__(self, entities, key=cell):
+		self.cells = {}
+		for entity in entities:
+			self.cells.setdefault(key(entity), []).append(entity)
+
+	def at(self, position):
+		return self.cells.get(position, ())
+
+def collide(movers, targets):
+	"""Returns the (mover, target) pairs that met during the last tick, call it after everything moved
+
+	Two entities met if they ended on the same cell or if they swapped cells (swept past each other),
+	every mover and every target is part of at most one pair. Runs in O(movers + targets)"""
+	current = CellIndex(targets)
+	before = CellIndex(targets, key=previous_cell)
+	taken = set()
+	pairs = []
+	for mover in movers:
+		position = cell(mover)
+		came_from = previous_cell(mover)
+		candidates = list(current.at(position)) + [target for target in before.at(position) if cell(target) == came_from]
+		for target in candidates:
+			if id(target) not in taken:
+				taken.add(id(target))
+				pairs.append((mover, target))
+				break
+	return pairs
+
+def remove_collided(movers, targets):
+	"""Removes every pair that met from both lists (in place) and returns how many pairs there were"""
+	pairs = collide(movers, targets)
+	if pairs:
+		hit = {id(entity) for pair in pairs for entity in pair}
+		movers[:] = [mover for mover in movers if id(mover) not in hit]
+		targets[:] = [target for target in targets if id(target) not in hit]
+	return len(pairs)
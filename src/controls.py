@@ -0,0 +1,104 @@
+"""Buttons instead of reactions, a press is routed to the game like a reaction and answered with the game's next frame
+
+With reactions every game start costs one request per emoji and every move costs a remove_reaction request plus the edit,
+a button press is answered by the edit itself so a move is a single request"""
+import asyncio
+import discord
+
+
+class ControlButton(discord.ui.Button):
+	def __init__(self, key):
+		if key.isalnum(): # prompt choices are numbers, the games use emojis
+			super().__init__(label=key, style=discord.ButtonStyle.secondary)
+		else:
+			super().__init__(emoji=key, style=discord.ButtonStyle.secondary)
+		self.key = key
+
+	async def callback(self, interaction):
+		controls = self.view
+		if not controls.router.press(interaction.message.id, interaction.user.id, self.key):
+			return await interaction.response.send_message("This isn't your game", ephemeral=True)
+		controls.renderer.answer(interaction) # the next frame of the game is the response
+
+
+class Controls(discord.ui.View):
+	"""The buttons of a game, a context manager that returns the inbox the presses go to and removes everything when the game ends"""
+	def __init__(self, router, renderer, users, keys):
+		super().__init__(timeout=None) # the session manager ends idle games
+		self.router = router
+		self.renderer = renderer
+		self.inbox = router.reactions(None, *users, emojis=keys)
+		self.msg = None
+		for key in keys:
+			self.add_item(ControlButton(key))
+
+	def attach(self, msg, edit=True):
+		"""Puts the buttons under msg (the next frame of msg carries them, edit=False if msg was sent with them), the buttons of the message before are removed"""
+		if self.msg:
+			self.renderer.submit(self.msg, view=None)
+		self.msg = msg
+		self.inbox.follow(msg)
+		if edit:
+			self.renderer.submit(msg, view=self)
+
+	def __enter__(self):
+		return self.inbox
+
+	def __exit__(self, *exc):
+		self.inbox.close()
+		self.stop()
+		if self.msg:
+			self.renderer.submit(self.msg, view=None)
+
+
+class Lobby(discord.ui.View):
+	"""Join/start buttons of a game anyone in the channel can play, the host starts it (or it starts by itself after the timeout)
+
+	limit is the most players that can join, None for no limit"""
+	shown = 50 # the most players listed in the embed, a description fits about 190 mentions
+
+	def __init__(self, renderer, host, embed, limit=None):
+		super().__init__(timeout=None) # the command decides how long the lobby stays open
+		self.renderer = renderer
+		self.host = host
+		self.embed = embed # the lobby message, the players are listed in it
+		self.limit = limit
+		self.players = {host.id: host} # user id -> user, in the order they joined
+		self.started = asyncio.Event()
+		self.msg = None
+		self.show()
+
+	def show(self):
+		mentions = [player.mention for player in list(self.players.values())[:self.shown]]
+		if len(self.players) > self.shown:
+			mentions.append(f'*and {len(self.players)-self.shown} more*')
+		self.embed.description = '\n'.join(mentions)
+		self.embed.set_footer(text=f'{len(self.players)} players' if self.limit is None else f'{len(self.players)}/{self.limit} players')
+		if self.msg:
+			self.renderer.submit(self.msg, embed=self.embed)
+
+	@discord.ui.button(label='Join', style=discord.ButtonStyle.primary)
+	async def join(self, interaction, button):
+		if interaction.user.bot or interaction.user.id in self.players or (self.limit is not None and len(self.players) >= self.limit):
+			return await interaction.response.send_message("You're already in this game" if interaction.user.id in self.players else "You can't join this game", ephemeral=True)
+		self.players[interaction.user.id] = interaction.user
+		self.show()
+		self.renderer.answer(interaction) # the new player list is the response
+
+	@discord.ui.button(label='Start', style=discord.ButtonStyle.success)
+	async def start(self, interaction, button):
+		if interaction.user.id != self.host.id:
+			return await interaction.response.send_message("Only the host can start the game", ephemeral=True)
+		self.renderer.answer(interaction)
+		self.started.set()
+
+	async def wait_for_start(self, msg, timeout):
+		"""Waits until the host pressed start or timeout seconds passed, removes the buttons and returns the players"""
+		self.msg = msg
+		try:
+			await asyncio.wait_for(self.started.wait(), timeout)
+		except asyncio.TimeoutError:
+			pass
+		self.stop()
+		self.renderer.submit(msg, view=None)
+		return list(self.players.values())
@@ -0,0 +1,191 @@
+"""The storyline cutscenes, the scenes are written in story.json and compiled into timelines once when the bot starts
+
+Every scene plays into a single message, the lines of a scene are turned into frames that are at least one render interval apart
+so the lines that fall into the same rate limit window are sent in one edit instead of one edit per line"""
+import asyncio
+import json
+import discord
+from controls import Controls
+from metrics import metrics
+
+colors = {'dark_theme': discord.Color.dark_theme, 'blurple': discord.Color.blurple}
+interactive = ('send', 'prompt', 'hook', 'next') # steps that stop the timeline, everything between them is played as one run of lines
+
+
+def as_tuple(flags):
+	if flags is None:
+		return ()
+	return (flags,) if isinstance(flags, str) else tuple(flags)
+
+def matches(condition, flags):
+	"""True if every "if" flag of a step is set and none of its "unless" flags are"""
+	need, avoid = condition
+	return all(flag in flags for flag in need) and not any(flag in flags for flag in avoid)
+
+def timeline(lines, window):
+	"""Turns (text, wait, replace) lines into (frames, length), a frame is (time, text, replace) and is sent at least window seconds after the frame before it
+
+	Lines that are due before the next frame can be sent are merged into it, text is None for steps that only wait"""
+	times = []
+	length = 0
+	for _, wait, _ in lines:
+		times.append(length)
+		length += wait
+	frames = []
+	i = 0
+	while i < len(lines):
+		if lines[i][0] is None:
+			i += 1
+			continue
+		at = times[i] if not frames else max(times[i], frames[-1][0]+window)
+		texts = []
+		replace = False
+		while i < len(lines) and times[i] <= at:
+			text, _, replaces = lines[i]
+			if text is not None:
+				if replaces:
+					texts = []
+					replace = True
+				texts.append(text)
+			i += 1
+		frames.append((at, '\n'.join(texts), replace))
+	return frames, length
+
+
+class Scene:
+	"""A compiled scene, the steps are grouped into parts: runs of lines that play on their own and the interactive steps between them"""
+	def __init__(self, data):
+		self.title = data.get('title')
+		self.color = data.get('color')
+		self.same_message = data.get('message') == 'same' # keep editing the message of the scene before this one
+		self.next = data.get('next')
+		self.parts = [] # ('lines', [(text, wait, replace, condition), ...], None) or (kind, step, condition)
+		for step in data['steps']:
+			condition = (as_tuple(step.get('if')), as_tuple(step.get('unless')))
+			kind = next((kind for kind in interactive if kind in step), None)
+			if kind:
+				self.parts.append((kind, step, condition))
+				continue
+			if not self.parts or self.parts[-1][0] != 'lines':
+				self.parts.append(('lines', [], None))
+			self.parts[-1][1].append((step.get('say'), step.get('wait', 0), step.get('replace', False), condition))
+
+class Playback:
+	"""One player going through the story, the hooks use it to add lines to the message of the current scene"""
+	def __init__(self, ctx, renderer, instant=False):
+		self.ctx = ctx
+		self.renderer = renderer
+		self.instant = instant # returning players get every scene in one edit
+		self.flags = set() # the choices the player made, scenes check them with "if"/"unless"
+		self.msg = None
+		self.embed = None
+
+	def fill(self, text):
+		return text.replace('{player}', self.ctx.author.display_name).replace('{name}', self.ctx.author.name)
+
+	def add(self, text, replace=False):
+		text = self.fill(text)
+		if replace or not self.embed.description:
+			self.embed.description = text
+		else:
+			self.embed.description += '\n'+text
+
+	async def show(self):
+		"""Sends the message of the scene the first time, edits it after that"""
+		if self.msg is None:
+			self.msg = await self.ctx.send(embed=self.embed)
+			metrics.shown(self.ctx)
+		else:
+			self.renderer.submit(self.msg, embed=self.embed)
+
+	async def say(self, text):
+		self.add(text)
+		await self.show()
+
+class Cutscenes:
+	"""Loads story.json once and plays its scenes, hooks are python coroutines the script calls for the parts that aren't just text"""
+	def __init__(self, router, renderer, path='story.json'):
+		self.router = router
+		self.renderer = renderer
+		with open(path, 'r', encoding='utf-8') as f:
+			self.scenes = {name: Scene(data) for name, data in json.load(f).items()}
+		self.hooks = {}
+		self.timelines = {} # (scene, part, visible lines, instant) -> (frames, length)
+
+	def hook(self, name):
+		"""Registers a hook, the hook gets the playback and the other keys of its step and can return the name of the scene to play next"""
+		def decorator(func):
+			self.hooks[name] = func
+			return func
+		return decorator
+
+	async def play(self, ctx, name, msg=None, instant=False):
+		"""Plays a scene and every scene it leads to, msg is edited instead of sending a new message for the first scene
+
+		Returns the message of the last scene"""
+		playback = Playback(ctx, self.renderer, instant)
+		playback.msg = msg
+		while name:
+			name = await self.play_scene(playback, name)
+		return playback.msg
+
+	async def play_scene(self, playback, name):
+		scene = self.scenes[name]
+		if not scene.same_message and playback.embed is not None:
+			playback.msg = None # every scene after the first one gets its own message
+		playback.embed = discord.Embed(title=scene.title, description='')
+		if scene.color:
+			playback.embed.color = colors[scene.color]()
+		for index, (kind, step, condition) in enumerate(scene.parts):
+			if kind == 'lines':
+				await self.play_lines(playback, (name, index), step)
+				continue
+			if not matches(condition, playback.flags):
+				continue
+			if playback.msg:
+				await self.renderer.flush(playback.msg) # the story has to be on screen before anything is sent under it
+			if kind == 'send':
+				await playback.ctx.send(playback.fill(step['send']))
+			elif kind == 'prompt':
+				choice = step['choices'][await self.prompt(playback, step)]
+				playback.flags.update(as_tuple(choice.get('set')))
+				if choice.get('next'):
+					return choice['next']
+			elif kind == 'hook':
+				after = await self.hooks[step['hook']](playback, **{key: value for key, value in step.items() if key not in ('hook', 'if', 'unless')})
+				if after:
+					return after
+			else:
+				return step['next']
+		return scene.next
+
+	async def play_lines(self, playback, key, lines):
+		visible = tuple(matches(line[3], playback.flags) for line in lines)
+		key = (*key, visible, playback.instant)
+		if key not in self.timelines:
+			shown = [(text, 0 if playback.instant else wait, replace) for (text, wait, replace, _), show in zip(lines, visible) if show]
+			self.timelines[key] = timeline(shown, self.renderer.interval)
+		frames, length = self.timelines[key]
+		loop = asyncio.get_event_loop()
+		start = loop.time()
+		for at, text, replace in frames:
+			delay = start + at - loop.time()
+			if delay > 0:
+				await asyncio.sleep(delay)
+			playback.add(text, replace)
+			await playback.show()
+		delay = start + length - loop.time()
+		if delay > 0:
+			await asyncio.sleep(delay)
+
+	async def prompt(self, playback, step):
+		"""Sends the question with a button per choice and returns the key of the choice, the default choice if the player doesn't answer in time"""
+		ctx = playback.ctx
+		controls = Controls(self.router, self.renderer, [ctx.author], list(step['choices']))
+		with controls as inputs:
+			controls.attach(await ctx.send(playback.fill(step['prompt']), view=controls), edit=False)
+			try:
+				choice = await inputs.get(timeout=step.get('timeout'))
+			except asyncio.TimeoutError:
+				choice = step['default']
+		return choice # the buttons are removed when the controls close, if one was pressed that edit is the response
@@ -0,0 +1,328 @@
+"""The game rules without any discord code, the commands in main.py only turn reactions/messages into inputs and the states into embeds"""
+import copy
+import random
+import re
+from collision import remove_collided
+
+from mazes import UP, DOWN, LEFT, RIGHT, STOP, CompiledMaze
+
+# very useful global variables
+directions = [UP, DOWN, LEFT, RIGHT]
+coordinate = re.compile(r'(?<!\S)(?:([a-z])([0-9]{1,2})|([0-9]{1,2})([a-z]))(?!\S)', re.IGNORECASE) # a speed coordinate, "a1" or "1a", between whitespace
+
+# zombies board
+board = [
+['g','g','g','g','q','G','q','g','g','g','g'],
+['g','g','g','g','q','G','q','g','g','g','g'],
+['g','g','g','g','q','G','q','g','g','g','g'],
+['g','g','g','g','q','G','q','g','g','g','g'],
+['q','q','q','q','q','G','q','q','q','q','q'],
+['G','G','G','G','G','p','G','G','G','G','G'],
+['q','q','q','q','q','G','q','q','q','q','q'],
+['g','g','g','g','q','G','q','g','g','g','g'],
+['g','g','g','g','q','G','q','g','g','g','g'],
+['g','g','g','g','q','G','q','g','g','g','g'],
+['g','g','g','g','q','G','q','g','g','g','g'],
+]
+
+storyline_mazes = ["wwwwwwwwww\nwp wx    w\nw        w\nwwwwwwwwww\n", "wwwwwwwwww\nwp wx    w\nw        w\nw wwwwwwww\n","w wwwwwwww\nwpw      w\nw w wwww w\nw w w  w w\nw w wx w w\nw w ww w w\nw w    w w\nw wwwwww w\nw        w\nwwwwwwwwww\n","ww        ww\nwp         w\n            \nww          \n          ww\n          xw\n  w         ","ww    www\nwp     ww\n         \n       ww\nww wx   w\nw       w\nw        \nw      ww\nww    www","wwwwwwww\nwp w   w\nw      w\nw      w\nww     w\nw   x  w\nw   w  w\n        ","wwwwwww\nwp    w\nw     w\nwbwwwbw\nw     w\nw    xw\nwwwwwww","    w       \nwpw        w\n     wwww   \n     w      \n            \n     wxw    \nw    www    \n w        ww","wwwwwlw\nwdd   w\ndpdx  w\nw www w\nw     u\nwrwwwww","wpw wwwwwwwwwww\nw u       ww   \nw www  ww ww  w\nw      ww ww  w\nwwwwwwwww ww  w\nww      w ww  w\nw  lw          \n    www wwwwwww\nw   wwx       w\nwwwwwww       w\n              w\n        wwwww w\nw              \nww     wwwwwwrw"]
+
+
+# Classes
+class Bullet:
+	"""The bullet's the player shoots"""
+	def __init__(self, direction, index):
+		self.index = index
+		self.direction = direction
+
+	def move(self):
+		self.index[0] += self.direction[0]
+		self.index[1] += self.direction[1]
+
+class Zombie:
+	"""Zombie logic"""
+	def __init__(self, direction):
+		if direction == DOWN:
+			self.index = [-1,5]
+		elif direction == LEFT:
+			self.index = [5, 11]
+		elif direction == UP:
+			self.index = [11, 5]
+		else:
+			self.index = [5, -1]
+		self.direction = direction
+
+	def move(self):
+		self.index[0] += self.direction[0]
+		self.index[1] += self.direction[1]
+
+class Alien:
+	"""Alien logic"""
+	def __init__(self, rng=random):
+		self.index = [-1, rng.randint(0, 4)]
+		self.direction = DOWN
+
+	def move(self):
+		self.index[0] += self.direction[0]
+		self.index[1] += self.direction[1]
+
+def random_cells(rows, columns, count, rng=random):
+	"""count different random cells of a rows x columns board, drawn as cell numbers instead of looking at the board so it costs O(count) on any board size"""
+	total = rows*columns
+	if count > total//2: # most of the board, drawing until the cells are different would repeat a lot
+		cells = rng.sample(range(total), count)
+	else:
+		cells = set()
+		while len(cells) < count:
+			cells.add(rng.randrange(total))
+	return [divmod(cell, columns) for cell in cells]
+
+def summon_blocks(board, rng=random):
+	"""Place 1-8 circles in random places on an empty speed board"""
+	for x, y in random_cells(len(board), len(board[0]), rng.randint(1, 8), rng):
+		board[x][y] = 'b'
+	return board
+
+def convert(coordinates, size=5):
+	"""Convert the speed coordinates into x, y coordinates, this way you could do both "a1" or "1a" (up to "j10" on a 10x10 board)
+
+	The tokens are found by one compiled regex instead of slicing every word, words that aren't coordinates are skipped"""
+	for letter, digit, digit_first, letter_last in coordinate.findall(coordinates):
+		x = int(digit or digit_first) - 1
+		y = ord((letter or letter_last).lower()) - ord("a")
+		if 0 <= x < size and 0 <= y < size:
+			yield x, y
+
+def check_zombie_collides(bullets, enemies):
+	"""Removes the zombies that got shot and the bullets that shot them, returns the number of zombies that got shot"""
+	return remove_collided(bullets, enemies)
+
+def get_player(lst):
+	"""Returns the x, y coordinates of the player on the board"""
+	for x, row in enumerate(lst):
+		for y, column in enumerate(row):
+			if column == 'p':
+				return x, y
+
+
+# Game states, every game is one state object and a step(state, inp) function that returns the next state
+# every state draws from its own random.Random, the same seed and the same inputs always play the same game (see replay.py)
+class ZombiesState:
+	"""Zombies game, the player sits in the middle of the board and shoots bullets at the zombies walking towards him"""
+	bullet_limit = 5
+	max_zombies = 5
+
+	def __init__(self, seed=None):
+		self.rng = random.Random(seed)
+		self.board = copy.deepcopy(board)
+		self.bullets = []
+		self.zombies = []
+		self.score = 0
+		self.over = False
+
+	def accepts_input(self):
+		"""The player can't shoot while all his bullets are still flying"""
+		return len(self.bullets) != self.bullet_limit
+
+	def render(self):
+		return self.board
+
+class SpaceshooterState:
+	"""Spaceshooter game, the ship moves on the bottom row and shoots upwards at the aliens"""
+	rows = 7
+	columns = 5
+	bullet_limit = 5
+	max_aliens = 5
+
+	def __init__(self, seed=None):
+		self.rng = random.Random(seed)
+		self.index = 2
+		self.bullets = []
+		self.aliens = []
+		self.lifes = 3
+		self.score = 0
+		self.hit = False # True if the ship got hit during the last tick
+		self.over = False
+
+	def render(self):
+		bord = [['g']*self.columns for _ in range(self.rows)]
+		for bullet in self.bullets:
+			bord[bullet.index[0]][bullet.index[1]] = 'L'
+		for alien in self.aliens:
+			bord[alien.index[0]][alien.index[1]] = 'a'
+		bord[self.rows-1][self.index] = 's'
+		return bord
+
+class MazeState:
+	"""One maze level, won or dead once the player reached the exit or fell of the maze"""
+	def __init__(self, maze, separator='\n'):
+		self.board = [list(line) for line in maze.split(separator)]
+		self.player = get_player(self.board)
+		self.compiled = CompiledMaze(self.board)
+		self.moves = 0
+		self.won = False
+		self.over = False
+
+	def render(self):
+		return self.board
+
+class SpeedState:
+	"""Speed game, every round a new set of circles is placed and the players send the coordinates of the circles they see"""
+	min_size = 3
+	max_size = 10 # the coordinates go up to j10
+
+	def __init__(self, players, goal=None, size=5, seed=None):
+		self.rng = random.Random(seed)
+		self.size = size
+		self.scores = {player:0 for player in players}
+		self.goal = goal # the first player to reach this score wins, None means the game goes on until it's stopped
+		self.winner = None
+		self.over = False
+		self.board = [['g']*size for _ in range(size)]
+		self.blocks = [] # the cells of the circles of this round
+		self.new_round()
+
+	def new_round(self):
+		"""Clears the circles of the last round and places 1-8 new ones, only the cells that change are touched so a round costs the same on every board size"""
+		for x, y in self.blocks:
+			self.board[x][y] = 'g'
+		self.blocks = random_cells(self.size, self.size, self.rng.randint(1, 8), self.rng)
+		for x, y in self.blocks:
+			self.board[x][y] = 'b'
+
+	def render(self):
+		return self.board
+
+
+def shoot(state, direction):
+	"""Zombies input, shoots a bullet into direction if the player has one left"""
+	if state.accepts_input():
+		state.bullets.append(Bullet(direction, [5,5]))
+
+def steer(state, direction):
+	"""Spaceshooter input, moves the ship one column LEFT/RIGHT (it wraps around)"""
+	state.index = (state.index + direction[1]) % state.columns
+
+def step_zombies(state, inp):
+	"""Advance the zombies game by one tick, inp is the direction to shoot a bullet in or None"""
+	board = state.board
+	rows, columns = len(board), len(board[0])
+	if inp is not None:
+		shoot(state, inp)
+	for entity in state.bullets + state.zombies:
+		if 0 <= entity.index[0] < rows and 0 <= entity.index[1] < columns:
+			board[entity.index[0]][entity.index[1]] = 'G'
+		entity.move()
+	state.score += check_zombie_collides(state.bullets, state.zombies)
+	state.bullets = [bullet for bullet in state.bullets if 0 <= bullet.index[0] < rows and 0 <= bullet.index[1] < columns]
+	for bullet in state.bullets:
+		board[bullet.index[0]][bullet.index[1]] = 'L'
+	for zombie in state.zombies:
+		board[zombie.index[0]][zombie.index[1]] = 'z'
+		if zombie.index == [5,5]:
+			state.over = True
+	if state.over:
+		return state
+	board[5][5] = 'p'
+	if len(state.zombies) < state.max_zombies:
+		zombie_number = state.rng.choice([0,0,0,0,1,1,1,2,2,3])
+		for direction in state.rng.sample(directions, zombie_number):
+			state.zombies.append(Zombie(direction))
+	return state
+
+def step_spaceshooter(state, inp):
+	"""Advance the spaceshooter game by one tick, inp is LEFT/RIGHT to move the ship or None to stay and shoot"""
+	state.hit = False
+	if len(state.bullets) != state.bullet_limit:
+		state.bullets.append(Bullet(UP, [state.rows-1, state.index]))
+	if inp is not None:
+		steer(state, inp)
+
+	if state.rng.randint(1, 10) >= 5 and len(state.aliens) <= state.max_aliens:
+		for _ in range(state.rng.randrange(1,3)):
+			alien = Alien(state.rng)
+			while alien.index in [a.index for a in state.aliens]:
+				alien = Alien(state.rng)
+			state.aliens.append(alien)
+
+	for entity in state.bullets + state.aliens:
+		entity.move()
+	state.score += remove_collided(state.bullets, state.aliens)
+	state.bullets = [bullet for bullet in state.bullets if bullet.index[0] >= 0]
+
+	for alien in state.aliens[:]:
+		if alien.index == [state.rows-1, state.index]:
+			state.lifes -= 1
+			state.hit = True
+			state.aliens.remove(alien)
+		elif alien.index[0] == state.rows:
+			state.aliens.remove(alien)
+	state.over = state.lifes <= 0
+	return state
+
+def step_maze(state, inp):
+	"""Move the player of a maze into the direction inp until he hits something"""
+	x, y = state.player
+	state.board[x][y] = ' '
+	state.moves += 1
+	outcome, end = state.compiled.move(state.player, inp)
+	if outcome != STOP: # fell of the maze or got stuck in a loop
+		state.over = True
+		return state
+	x, y = end
+	if state.board[x][y] == 'x':
+		state.won = True
+		state.over = True
+	state.board[x][y] = 'p'
+	state.player = (x, y)
+	return state
+
+def answer(state, player, coordinates):
+	"""Score one message against the circles of the round, a circle only counts for the first one to send it. Returns True once the player won
+
+	coordinates is the text of the message or the (x, y) cells convert already found in it"""
+	for x, y in convert(coordinates, state.size) if isinstance(coordinates, str) else coordinates:
+		if state.board[x][y] == 'b':
+			state.board[x][y] = 'g' # taken
+			state.scores[player] += 1
+			if state.goal and state.scores[player] >= state.goal:
+				state.winner = player
+				state.over = True
+				return True
+		elif state.scores[player] > 0:
+			state.scores[player] -= 1
+	return False
+
+def step_speed(state, inp):
+	"""Score the messages of a round and place the circles of the next round
+
+	inp is (player, coordinates), a list of them (every message of the round, in the order they came in) or None if nobody answered"""
+	if isinstance(inp, tuple):
+		inp = [inp]
+	for player, coordinates in inp or ():
+		if answer(state, player, coordinates):
+			return state
+	state.new_round()
+	return state
+
+steps = {ZombiesState: step_zombies, SpaceshooterState: step_spaceshooter, MazeState: step_maze, SpeedState: step_speed}
+actions = {ZombiesState: shoot, SpaceshooterState: steer} # the real time games, their inputs can be applied without stepping
+
+def step(state, inp):
+	"""Advance any game state by one input"""
+	return steps[type(state)](state, inp)
+
+def tick(state, inputs):
+	"""Advance a real time game by one tick, every input that came in since the last tick is applied first, in the order they came in"""
+	action = actions[type(state)]
+	for inp in inputs:
+		action(state, inp)
+	return step(state, None)
+
+def simulate(state, inputs):
+	"""Run a game offline, feeds inputs into the state until the game is over or the inputs run out"""
+	for inp in inputs:
+		if state.over:
+			break
+		state = step(state, inp)
+	return state
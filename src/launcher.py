@@ -0,0 +1,73 @@
+"""Runs the bot as several worker processes, every worker runs main.py with its share of the shards
+
+	python launcher.py
+
+WORKERS is the number of processes (default: one per core) and SHARD_COUNT the total number of shards (default: what discord recommends),
+every worker connects to scores.db on its own so the scores, progress and mazes are shared between them"""
+import asyncio
+import os
+import subprocess
+import sys
+import time
+import discord
+from dotenv import load_dotenv
+import storage
+
+here = os.path.dirname(os.path.abspath(__file__))
+
+
+async def recommended_shards(token):
+	"""The number of shards discord recommends for the bot"""
+	http = discord.http.HTTPClient(asyncio.get_running_loop())
+	try:
+		await http.static_login(token)
+		shards, _, _ = await http.get_bot_gateway()
+		return shards
+	finally:
+		await http.close()
+
+async def prepare_db():
+	"""Creates the tables and moves the old cache.json/levels.txt files once, before the workers race each other to do it"""
+	db, *_ = await storage.connect(os.path.join(here, 'scores.db'))
+	await db.close()
+
+def split(shard_count, workers):
+	"""Spreads the shard ids over the workers, returns one list of ids per worker"""
+	return [list(range(shard_count))[worker::workers] for worker in range(workers)]
+
+def start_worker(index, shard_ids, shard_count):
+	env = {**os.environ, 'SHARD_COUNT': str(shard_count), 'SHARD_IDS': ','.join(map(str, shard_ids))}
+	if os.getenv('METRICS_PORT'): # every worker serves its own metrics, on the ports after METRICS_PORT
+		env['METRICS_PORT'] = str(int(os.getenv('METRICS_PORT')) + index)
+	if os.getenv('METRICS_FILE'): # metrics.prom -> metrics-0.prom, metrics-1.prom, ...
+		root, extension = os.path.splitext(os.getenv('METRICS_FILE'))
+		env['METRICS_FILE'] = f'{root}-{index}{extension}'
+	return subprocess.Popen([sys.executable, 'main.py'], cwd=here, env=env)
+
+def main():
+	load_dotenv()
+	token = os.getenv('TOKEN')
+	shard_count = int(os.getenv('SHARD_COUNT') or asyncio.run(recommended_shards(token)))
+	workers = min(int(os.getenv('WORKERS') or os.cpu_count() or 1), shard_count)
+	asyncio.run(prepare_db())
+
+	groups = split(shard_count, workers)
+	processes = [start_worker(index, shard_ids, shard_count) for index, shard_ids in enumerate(groups)]
+	print(f'Started {workers} workers for {shard_count} shards')
+	try:
+		while True:
+			time.sleep(5)
+			for index, process in enumerate(processes):
+				if process.poll() is not None: # crashed, its shards are offline until it's back
+					print(f'Worker {index} (shards {groups[index]}) exited with {process.returncode}, restarting it')
+					processes[index] = start_worker(index, groups[index], shard_count)
+	except KeyboardInterrupt:
+		pass
+	finally:
+		for process in processes:
+			process.terminate()
+		for process in processes:
+			process.wait()
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,352 @@
+"""Load test of the games without discord, synthetic players play the real game commands of main.py against a fake discord
+
+	python loadtest.py --players 200 --game zombies --duration 60
+
+The fake discord answers every request after --latency seconds and enforces the rate limits discord has
+(5 sends, 5 edits and 5 deletes per 5 seconds per channel, 50 requests per second per bot), a request over a limit gets a 429
+and is retried after retry_after like discord.py does. Every player gets its own channel and plays one game after the other
+until the time is up. The report has the frame latency (a frame being submitted -> its edit being done), the edits/sec,
+the 429s and the event loop lag (how late a 50ms timer fires), the lag is what shows that the process is at its limit"""
+import argparse
+import asyncio
+import itertools
+import os
+import random
+import shutil
+import tempfile
+import time
+import discord
+import storage
+import replay
+from controls import Controls
+import main
+
+ids = itertools.count(1000000000000000000) # snowflakes of the fake users, channels and messages
+
+
+class Bucket:
+	"""A rate limit, limit requests per per seconds"""
+	def __init__(self, limit, per):
+		self.limit = limit
+		self.per = per
+		self.reset = 0
+		self.remaining = limit
+
+	def take(self, now):
+		"""Returns 0 if the request can go through, otherwise the retry_after of the 429"""
+		if now >= self.reset:
+			self.reset = now + self.per
+			self.remaining = self.limit
+		if self.remaining:
+			self.remaining -= 1
+			return 0
+		return self.reset - now
+
+class FakeDiscord:
+	"""Stand-in for discord's REST api, every fake message/channel/interaction sends its requests through it"""
+	def __init__(self, latency=0.05, jitter=0.5):
+		self.latency = latency # seconds a request takes
+		self.jitter = jitter # the latency varies by this share of it
+		self.buckets = {} # (route, channel id) -> bucket
+		self.world = Bucket(50, 1) # the global limit of a bot
+		self.requests = {} # route -> requests that went through
+		self.limited = 0 # 429s
+		self.answered_twice = 0 # button presses that got a second response, discord rejects one of them
+		self.latencies = [] # seconds from submitting a frame until its edit was done
+		self.submitted = {} # message id -> when its newest frame was submitted
+
+	async def request(self, route, channel_id=None):
+		loop = asyncio.get_event_loop()
+		while True:
+			now = loop.time()
+			retry_after = self.world.take(now) if route != 'interaction' else 0 # interaction responses don't count against the global limit
+			if not retry_after and channel_id is not None:
+				retry_after = self.buckets.setdefault((route, channel_id), Bucket(5, 5)).take(now)
+			if not retry_after:
+				break
+			self.limited += 1
+			await asyncio.sleep(retry_after + self.latency) # the 429 response takes a round trip too
+		await asyncio.sleep(self.latency * random.uniform(1-self.jitter, 1+self.jitter))
+		self.requests[route] = self.requests.get(route, 0) + 1
+
+	async def edit(self, msg, route, **kwargs):
+		"""An edit of msg, its latency is measured from the submit of the newest frame it carries"""
+		submitted = self.submitted.pop(msg.id, None)
+		await self.request(route, msg.channel.id if route == 'edit' else None)
+		msg.apply(**kwargs)
+		if submitted is not None:
+			self.latencies.append(asyncio.get_event_loop().time() - submitted)
+
+
+class FakeUser:
+	def __init__(self, name):
+		self.id = next(ids)
+		self.name = self.display_name = name
+		self.mention = f'<@{self.id}>'
+		self.bot = False
+
+class FakeGuild:
+	def __init__(self):
+		self.id = next(ids)
+
+class FakeMessage:
+	def __init__(self, api, channel, author, content=None, embed=None, view=None):
+		self.api = api
+		self.id = next(ids)
+		self.channel = channel
+		self.author = author
+		self.content = content
+		self.embed = embed
+		self.view = view
+		self.deleted = False
+
+	def apply(self, content=discord.utils.MISSING, embed=discord.utils.MISSING, view=discord.utils.MISSING):
+		if content is not discord.utils.MISSING:
+			self.content = content
+		if embed is not discord.utils.MISSING:
+			self.embed = embed
+		if view is not discord.utils.MISSING:
+			self.view = view
+
+	async def edit(self, **kwargs):
+		if self.deleted:
+			raise discord.NotFound(FakeResponse(404), 'Unknown Message')
+		await self.api.edit(self, 'edit', **kwargs)
+		return self
+
+	async def delete(self, delay=None):
+		if delay:
+			await asyncio.sleep(delay)
+		await self.api.request('delete', self.channel.id)
+		self.deleted = True
+
+class FakeResponse:
+	"""What discord.HTTPException needs of an aiohttp response"""
+	def __init__(self, status):
+		self.status = status
+		self.reason = 'fake'
+
+class FakeChannel:
+	def __init__(self, api, guild):
+		self.api = api
+		self.id = next(ids)
+		self.guild = guild
+		self.messages = [] # the messages the bot sent, newest last
+
+	async def delete_messages(self, messages):
+		await self.api.request('bulk_delete', self.id)
+		for msg in messages:
+			msg.deleted = True
+
+	async def send(self, content=None, embed=None, view=None, delete_after=None):
+		await self.api.request('send', self.id)
+		msg = FakeMessage(self.api, self, main.bot.user, content, embed, view)
+		self.messages = self.messages[-20:] + [msg]
+		if delete_after:
+			asyncio.get_event_loop().create_task(msg.delete(delete_after))
+		return msg
+
+class FakeInteractionResponse:
+	def __init__(self, interaction):
+		self.interaction = interaction
+		self.done = False
+		self.started = False
+
+	def is_done(self):
+		return self.done
+
+	def start(self):
+		if self.started:
+			self.interaction.api.answered_twice += 1
+		self.started = True
+
+	# like discord.py the response only counts as done once its request returned
+	async def send_message(self, content=None, ephemeral=False):
+		self.start()
+		await self.interaction.api.request('interaction')
+		self.done = True
+
+	async def edit_message(self, **kwargs):
+		self.start()
+		await self.interaction.api.edit(self.interaction.message, 'interaction', **kwargs)
+		self.done = True
+
+	async def defer(self):
+		self.start()
+		await self.interaction.api.request('interaction')
+		self.done = True
+
+class FakeInteraction:
+	"""A button press"""
+	def __init__(self, api, message, user):
+		self.api = api
+		self.message = message
+		self.user = user
+		self.response = FakeInteractionResponse(self)
+
+class FakeContext:
+	"""What the game commands use of a commands.Context"""
+	def __init__(self, api, author, channel, command):
+		self.author = author
+		self.channel = channel
+		self.guild = channel.guild
+		self.message = FakeMessage(api, channel, author, f'%{command.qualified_name}')
+		self.command = command
+		self.prefix = '%'
+		self.command_failed = False
+
+	async def send(self, *args, **kwargs):
+		return await self.channel.send(*args, **kwargs)
+
+
+class Player:
+	"""A synthetic player, plays one game after the other in its own channel until it's cancelled"""
+	def __init__(self, api, game, think):
+		self.api = api
+		self.game = game
+		self.think = think # seconds between two inputs, like a human
+		self.user = FakeUser(f'player{next(ids) % 100000}')
+		self.channel = FakeChannel(api, FakeGuild())
+		self.games = 0
+		self.inputs = 0
+		self.errors = [] # exceptions the games raised
+
+	async def run(self):
+		while True:
+			game = self.game if self.game != 'mix' else random.choice(['zombies', 'spaceshooter', 'maze', 'speed'])
+			ctx = FakeContext(self.api, self.user, self.channel, main.bot.get_command(game))
+			task = asyncio.get_event_loop().create_task(self.play(ctx))
+			try:
+				await main.open_session(ctx)
+				await ctx.command.callback(ctx)
+			except Exception as error:
+				self.errors.append(error)
+			finally:
+				task.cancel()
+				await main.close_session(ctx)
+			self.games += 1
+
+	async def play(self, ctx):
+		while True:
+			await asyncio.sleep(random.uniform(self.think/2, self.think*1.5))
+			if ctx.command.name == 'speed':
+				await self.answer(ctx)
+			else:
+				await self.press()
+
+	async def press(self):
+		"""Presses a random button of the newest game message, the flag (giving up) is left out so the games end the normal way"""
+		msg = next((msg for msg in reversed(self.channel.messages) if isinstance(msg.view, Controls)), None)
+		if msg is None:
+			return
+		buttons = [button for button in msg.view.children if button.key != '🏳']
+		if buttons:
+			self.inputs += 1
+			await random.choice(buttons).callback(FakeInteraction(self.api, msg, self.user))
+
+	async def answer(self, ctx):
+		"""Sends the coordinates of the circles on the board (with a wrong one now and then), stops after 20 answers"""
+		session = main.sessions.sessions.get(ctx.message.id)
+		if session is None or session.state is None:
+			return
+		board = session.state.board
+		letters = 'abcdefghij'[:len(board)]
+		coordinates = [f'{letters[y]}{x+1}' for x, row in enumerate(board) for y, tile in enumerate(row) if tile == 'b']
+		if random.random() < 0.2:
+			coordinates.append(f'{random.choice(letters)}{random.randint(1, len(board))}')
+		self.inputs += 1
+		content = 'stop' if self.inputs % 20 == 0 else ' '.join(coordinates)
+		main.router.route(main.router.message_inboxes, (self.channel.id, self.user.id), FakeMessage(self.api, self.channel, self.user, content))
+
+
+async def watch_lag(lags, interval=0.05):
+	"""Measures how late a timer fires, the time the event loop was busy with something else"""
+	loop = asyncio.get_event_loop()
+	while True:
+		start = loop.time()
+		await asyncio.sleep(interval)
+		lags.append(loop.time() - start - interval)
+
+def percentiles(values):
+	if not values:
+		return '-'
+	values = sorted(values)
+	pick = lambda share: values[min(int(len(values)*share), len(values)-1)]*1000
+	return f'p50 {pick(0.5):.0f}ms  p95 {pick(0.95):.0f}ms  p99 {pick(0.99):.0f}ms  max {values[-1]*1000:.0f}ms'
+
+async def prepare_bot(directory):
+	"""The stores main.py needs on a temporary database, every player already finished the storyline so the cutscenes are instant"""
+	db = await storage.aiosqlite.connect(os.path.join(directory, 'scores.db'))
+	main.bot.db = db
+	main.bot.scores = storage.ScoreStore(db)
+	await main.bot.scores.setup()
+	main.bot.progress = storage.ProgressStore(db)
+	await main.bot.progress.setup(legacy_file=os.path.join(directory, 'cache.json'))
+	main.bot.mazes = storage.MazeStore(db)
+	await main.bot.mazes.setup(legacy_file=os.path.join(directory, 'levels.txt'))
+	main.bot.replays = storage.ReplayStore(db)
+	await main.bot.replays.setup()
+	main.bot._connection.user = FakeUser('bot')
+	return db
+
+async def run(args):
+	random.seed(args.seed)
+	directory = tempfile.mkdtemp()
+	db = await prepare_bot(directory)
+	main.sessions.limits = {scope: args.players for scope in main.sessions.limits} # one user, channel and guild per player anyway
+	api = FakeDiscord(args.latency)
+	submit = main.renderer.submit
+	def timed_submit(msg, **kwargs):
+		api.submitted.setdefault(msg.id, asyncio.get_event_loop().time()) # the oldest frame that wasn't sent, the wait of the players
+		submit(msg, **kwargs)
+	main.renderer.submit = timed_submit
+
+	players = [Player(api, args.game, args.think) for _ in range(args.players)]
+	for player in players:
+		await main.bot.progress.complete(player.user.id, *storage.ProgressStore.chapters, commit=False)
+	await db.commit()
+	lags = []
+	tasks = [asyncio.get_event_loop().create_task(watch_lag(lags))]
+	for player in players:
+		tasks.append(asyncio.get_event_loop().create_task(player.run()))
+		await asyncio.sleep(args.ramp/len(players)) # the players join over the ramp up time
+	start = time.monotonic()
+	await asyncio.sleep(args.duration)
+	elapsed = time.monotonic() - start + args.ramp
+	for task in tasks:
+		task.cancel()
+	await asyncio.gather(*tasks, return_exceptions=True)
+	main.renderer.submit = submit
+	await main.bot.scores.flush()
+	replays = await main.bot.replays.best(limit=args.players) # every saved replay should play out to its score again
+	mismatches = sum(not replay.verify(log)[0] for _, _, _, log in replays)
+	await db.close()
+	shutil.rmtree(directory)
+
+	edits = api.requests.get('edit', 0) + api.requests.get('interaction', 0)
+	print(f'{args.players} players playing {args.game} for {elapsed:.0f}s, {args.latency*1000:.0f}ms request latency')
+	print(f'games:          {sum(player.games for player in players)} finished, {sum(player.inputs for player in players)} inputs')
+	print('requests:       ' + ', '.join(f'{route} {count}' for route, count in sorted(api.requests.items())))
+	print(f'edits/sec:      {edits/elapsed:.1f}')
+	print(f'429s:           {api.limited}')
+	print(f'answered twice: {api.answered_twice}')
+	print(f'frame latency:  {percentiles(api.latencies)}')
+	print(f'event loop lag: {percentiles(lags)}')
+	print(f'replays:        {len(replays)} verified, {mismatches} mismatches')
+	errors = [error for player in players for error in player.errors]
+	if errors:
+		print(f'errors:         {len(errors)}, the first one: {errors[0]!r}')
+
+def main_cli():
+	parser = argparse.ArgumentParser(description='Load test of the games against a fake discord')
+	parser.add_argument('--players', type=int, default=100)
+	parser.add_argument('--game', choices=['zombies', 'spaceshooter', 'maze', 'speed', 'mix'], default='mix')
+	parser.add_argument('--duration', type=float, default=30, help='seconds to run after every player joined')
+	parser.add_argument('--ramp', type=float, default=5, help='seconds over which the players join')
+	parser.add_argument('--think', type=float, default=1, help='average seconds between two inputs of a player')
+	parser.add_argument('--latency', type=float, default=0.05, help='seconds a request to the fake discord takes')
+	parser.add_argument('--seed', type=int, default=2022)
+	asyncio.run(run(parser.parse_args()))
+
+if __name__ == '__main__':
+	main_cli()
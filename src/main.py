@@ -1,26 +1,42 @@
 import discord
 from discord.ext import commands
-import copy
 import os
 import random
 import asyncio
-import aiosqlite
-import json
+import time
+from typing import Optional
 from dotenv import load_dotenv
+from render import RenderScheduler, BoardRenderer
+from cutscenes import Cutscenes
+from router import InputRouter
+from controls import Controls, Lobby
+from clock import TickClock
+from sessions import SessionManager, SessionLimit, deep_size
+import storage
+from metrics import metrics
+from mazes import rate, TooComplex
+from replay import Recorder
+from engine import UP, DOWN, LEFT, RIGHT, storyline_mazes, ZombiesState, SpaceshooterState, MazeState, SpeedState, convert, tick, step_maze, step_speed
 
 load_dotenv()
 
-with open("cache.json", "r") as f:
-    cache = json.load(f)
 
-def update_cache(ctx):
-	try:
-		if ctx.command.name not in cache[str(ctx.author.id)]:
-			cache[str(ctx.author.id)] += [ctx.command.name]
-	except KeyError:
-		cache[str(ctx.author.id)] = [ctx.command.name]
+async def update_cache(ctx):
+	"""Saves that the player played this chapter of the storyline"""
+	await bot.progress.complete(ctx.author.id, ctx.command.name)
 
-bot = commands.Bot(command_prefix='%', intents=discord.Intents.all(), case_insenstive=True)
+# SHARD_COUNT/SHARD_IDS are set by launcher.py for every worker process, without them this process runs every shard
+shard_count = int(os.getenv('SHARD_COUNT')) if os.getenv('SHARD_COUNT') else None
+shard_ids = [int(shard_id) for shard_id in os.getenv('SHARD_IDS').split(',')] if os.getenv('SHARD_IDS') else None
+if os.getenv('CACHE_MODE') == 'lean': # only the gateway events the games use, no members/presences/messages are cached
+	intents = discord.Intents.none()
+	intents.guilds = True # channels and permissions
+	intents.messages = True
+	intents.message_content = True # the commands and the speed/unscramble answers, buttons don't need an intent
+	cache_settings = dict(intents=intents, member_cache_flags=discord.MemberCacheFlags.none(), max_messages=None, chunk_guilds_at_startup=False)
+else:
+	cache_settings = dict(intents=discord.Intents.all())
+bot = commands.AutoShardedBot(command_prefix='%', case_insenstive=True, shard_count=shard_count, shard_ids=shard_ids, **cache_settings)
 
 class BotHelp(commands.MinimalHelpCommand): # A very simple help command
 	async def send_pages(self):
@@ -31,774 +47,156 @@ class BotHelp(commands.MinimalHelpCommand): # A very simple help command
 
 bot.help_command=BotHelp()
 
+renderer = RenderScheduler() # every game frame goes through this instead of awaiting msg.edit
+sessions = SessionManager(idle_timeout=int(os.getenv('SESSION_IDLE_TIMEOUT', 300))) # the running games, idle ones are cancelled after the timeout
+router = InputRouter(bot, on_input=sessions.touch) # every button press/message a game waits for goes through this instead of bot.wait_for
+clock = TickClock() # zombies and spaceshooter step on its ticks
+story = Cutscenes(router, renderer) # the storyline scenes, written in story.json
+metrics.gauge('sessions_active', lambda: {(('game', game),): count for game, count in sessions.per_game().items()})
+metrics.gauge('event_loop_lag_last_seconds', lambda: metrics.lag)
+
 words = ['gun','game','end','spaceship','zombies','john','caroline','rapheal','adam','maze','flushed']
 
-# very useful global variables
-UP = (-1, 0)
-DOWN = (1, 0)
-LEFT = (0, -1)
-RIGHT = (0, 1)
 conversion = {'⬆':UP,'⬅':LEFT,'➡':RIGHT,'⬇':DOWN}
-directions = [UP, DOWN, LEFT, RIGHT]
-
-
-# Classes
-class Bullet:
-	"""The bullet's the player shoots"""
-	def __init__(self, direction, index):
-		self.index = index
-		self.direction = direction
-
-	def move(self):
-		self.index[0] += self.direction[0]
-		self.index[1] += self.direction[1]
-
-class Zombie:
-	"""Zombie logic"""
-	def __init__(self, direction):
-		if direction == DOWN:
-			self.index = [-1,5]
-		elif direction == LEFT:
-			self.index = [5, 11]
-		elif direction == UP:
-			self.index = [11, 5]
-		else:
-			self.index = [5, -1]
-		self.direction = direction
-
-	def move(self):
-		self.index[0] += self.direction[0]
-		self.index[1] += self.direction[1]
-
-class Alien:
-	"""Alien logic"""
-	def __init__(self):
-		self.index = [-1, random.randint(0, 4)]
-		self.direction = DOWN
-
-	def move(self):
-		self.index[0] += self.direction[0]
-		self.index[1] += self.direction[1]
-
-def summon_blocks(board):
-	"""Place 1-8 circles in random places on the speed board"""
-	for _ in range(random.randint(1, 8)):
-		x = random.randint(0, 4)
-		y = random.randint(0, 4)
-		while board[x][y] != 'g':
-			x = random.randint(0, 4)
-			y = random.randint(0, 4)
-		board[x][y] = 'b'
-	return board
-
-def convert(coordinates):
-	"""Convert the speed coordinates into x, y coordinates, this way you could do both "a1" or "1a"""
-	for coor in coordinates.split(' '):
-		if len(coor) != 2:
-			continue
-
-		coor = coor.lower()
-		if coor[0].isalpha():
-			digit = coor[1:]
-			letter = coor[0]
-		else:
-			digit = coor[:-1]
-			letter = coor[-1]
-
-		if not digit.isdecimal():
-			continue
 
-		x = int(digit) - 1
-		y = ord(letter) - ord("a")
-
-		if (not x in range(5)) or (not y in range(5)):
-			continue
-		yield x, y
-
-def format_board(board):
-	"""A nested list formater, uses a dict to turn letters into emojis"""
-	lst = []
-	dct = {'g':'⬛','G':'🟩','q':'🟦','p':'😳','L':'📍','z':'🧟','e':random.choice(['🌎','🌍','🌏']),'B':'💥', 's':'🚀', 'a':'👾', 'o':'💣', 'w':'🟥', 'x':'❌',' ':'⬛','u':'⏫','l':'⏪','r':'⏩','d':'⏬','b':'🔲'}
-	for row in board:
-		lst.append(''.join([dct[i] for i in row]))
-	return '\n'.join(lst)
-
-def format_speed_board(board):
-	"""Speed board requires coordinates a boarder so i made a different function for it"""
-	dct = {'g':'⬛','b':'b'}
-	for i in range(1, 6):
-		dct[i] = f"{i}\N{variation selector-16}\N{combining enclosing keycap}"
-	lst = [f":stop_button::regional_indicator_a::regional_indicator_b::regional_indicator_c::regional_indicator_d::regional_indicator_e:"]
-	for num, row in enumerate(board, start=1):
-		lst.append(dct[num]+''.join([dct[column] if column != 'b' else random.choice(['🔴','🟠','🟡','🟢','🔵','🟣','🟤']) for column in row]))
+format_board = BoardRenderer().render # for one off boards, the games use their own BoardRenderer so their rows stay cached
+
+speed_glyphs = {'g':'⬛'}
+circles = ['🔴','🟠','🟡','🟢','🔵','🟣','🟤']
+keycaps = [f"{i}\N{variation selector-16}\N{combining enclosing keycap}" for i in range(1, 10)] + ['🔟']
+speed_layouts = {} # board size -> (header, keycap of every row, every row without circles)
+
+def speed_layout(size):
+	"""The parts of a speed board that don't change between frames, built once per board size"""
+	if size not in speed_layouts:
+		header = ':stop_button:' + ''.join(f':regional_indicator_{chr(ord("a")+column)}:' for column in range(size))
+		speed_layouts[size] = (header, keycaps[:size], [keycap + speed_glyphs['g']*size for keycap in keycaps[:size]])
+	return speed_layouts[size]
+
+def format_speed_board(board, blocks=None):
+	"""Speed board requires coordinates a boarder so i made a different function for it, the circles get a random color every frame
+
+	blocks are the cells of the circles if the caller knows them, only their rows are built and the rest comes from the layout
+	so a frame costs about the same on a 10x10 board as on a 5x5 one"""
+	header, row_keycaps, empty_rows = speed_layout(len(board))
+	if blocks is None:
+		blocks = [(x, y) for x, row in enumerate(board) for y, column in enumerate(row) if column == 'b']
+	empty = speed_glyphs['g']
+	rows = {}
+	for x, y in blocks:
+		rows.setdefault(x, []).append(y)
+	lst = [header, *empty_rows]
+	for x, columns in rows.items():
+		line = row_keycaps[x]
+		last = -1
+		for y in sorted(columns):
+			line += empty*(y-last-1) + random.choice(circles)
+			last = y
+		lst[x+1] = line + empty*(len(board)-last-1)
 	return "\n".join(lst)
 
-def check_zombie_collides(board, bullets, enemies, score):
-	"""Check if a zombie collided with a bullet"""
-	for enemy in enemies:
-		for bullet in bullets:
-			collide = False
-			try:
-				if bullet.index == enemy.index:
-					board[bullet.index[0]][bullet.index[1]] = 'G'
-					collide = True
-				elif bullet.index == [enemy.index[0]+1,enemy.index[1]]:
-					board[enemy.index[0]][enemy.index[1]] = 'G'
-					board[enemy.index[0]+1][enemy.index[1]] = 'G'
-					collide = True
-				elif bullet.index == [enemy.index[0]-1, enemy.index[1]]:
-					board[enemy.index[0]][enemy.index[1]] = 'G'
-					board[enemy.index[0]-1][enemy.index[1]] = 'G'
-					collide = True
-				elif bullet.index == [enemy.index[0], enemy.index[1]+1]:
-					board[enemy.index[0]][enemy.index[1]] = 'G'
-					board[enemy.index[0]][enemy.index[1]+1] = 'G'
-					collide = True
-				elif bullet.index == [enemy.index[0], enemy.index[1]-1]:
-					board[enemy.index[0]][enemy.index[1]] = 'G'
-					board[enemy.index[0]][enemy.index[1]-1] = 'G'
-					collide = True
-			except IndexError:
-				collide = True
-			if collide:
-				try:
-					bullets.remove(bullet)
-				except ValueError:
-					pass
-				try:
-					enemies.remove(enemy)
-				except ValueError:
-					pass
-				score += 1
-	return board, bullets, enemies, score
-
-async def scene_1(ctx, msg):
-	"""Scene 1, played when you use the zombie command"""
-	embed = discord.Embed(title='Chapter 1: What happened', description=f"**???:** *WAKE UP KID*", color=discord.Color.dark_theme())
-	await msg.edit(embed=embed)
-	await asyncio.sleep(1)
-	embed.description += f"\n**{ctx.author.display_name}:** *what's happening... wait Raphael? what happened?*"
-	await msg.edit(embed=embed)
-	await asyncio.sleep(2)
-	embed.description += '\n**Raphael:** *ZOMBIES ARE SURROINDING US, TAKE THIS GUN*'
-	await msg.edit(embed=embed)
-	await asyncio.sleep(1.5)
-	embed.description += f"\n**{ctx.author.display_name}:** *AAAAAAAAAA, THE ZOMBIES ARE EVERYWHERE!*"
-	await msg.edit(embed=embed)
-	await ctx.send('__**Instructions:**__\nThis is you: 😳\nThese are bullets: 📍\nThese are zombies: 🧟\n\n**How to play:** wait till all the reactions have been added, then react to reactions pointing in the direction you want to shoot a bullet in, make sure the zombies don\'t touch you and goodluck!')
-	await asyncio.sleep(.5)
-
-async def scene_2(ctx, msg):
-	"""Scene 2, played when you use the spaceshooter command"""
-	embed = discord.Embed(title='Chapter 2: The spaceship',description='' ,color=discord.Color.dark_theme())
-	await msg.edit(embed=embed)
-	await asyncio.sleep(.5)
-	embed.description = "**John:** *THERE ARE SO MANY ZOMBIES, WE NEED TO GO NOW*"
-	await msg.edit(embed=embed)
-	await asyncio.sleep(1)
-	embed.description += "\n**Raphael:** *CMON, LET'S GO, ADAM PROBABLY FINISHED WORKING ON THE SPACESHIP*"
-	await msg.edit(embed=embed)
-	await asyncio.sleep(1.5)
-	embed.description += f"\n**{ctx.author.display_name}:** *??? WHAT SPACESHIP, CAN ANYONE PLEASE EXPLAIN TO ME WHAT'S HAPPENING*"
-	await msg.edit(embed=embed)
-	for i in range(1, 7):
-		await msg.edit(embed=discord.Embed(title='Chapter 2: The spaceship', description=embed.description+"\n"+'.'*(i if i < 4 else i-3), color=discord.Color.dark_theme()))
-		await asyncio.sleep(.3)
-	embed.description += "\n**Raphael:** *okay, we are safe **for now**, how's the ship's status Adam?*"
-	await msg.edit(embed=embed)
-	await asyncio.sleep(1.5)
-	embed.description += "\n**Adam:** *I was able to fix the spaceship for the most part but the spaceship could only have 4 people onboard, someone has to be left behind...*"
-	await msg.edit(embed=embed)
-	await asyncio.sleep(2.5)
-	embed.description += "\n**John:** *I will do it, it was a great run guys but this is where my story ends, goodluck!*"
-	await msg.edit(embed=embed)
-	await asyncio.sleep(3)
+@story.hook('spaceship_launch')
+async def spaceship_launch(playback):
+	"""The spaceship leaving earth right before it explodes, skipped for players that already saw it"""
+	if playback.instant:
+		return
 	bord = [['g']*7 for i in range(7)]
 	bord[3][0] = 'e'
 	index = [3,1]
 	bord[index[0]][index[1]] = 's'
+	view = BoardRenderer()
 	for i in range(5):
-		embed = discord.Embed(title='Chapter 2: The spaceship', description=format_board(bord), color=discord.Color.dark_theme())
-		await msg.edit(embed=embed)
+		playback.embed.description = view.render(bord)
+		await playback.show()
 		bord[index[0]][index[1]] = 'g'
 		index[1] += 1
 		if i == 2:
 			bord[3][0] = 'B'
 		bord[index[0]][index[1]] = 's'
-		await asyncio.sleep(.5)
-	await ctx.send('__**Part 2:**__ you and the rest of the group were able to leave earth just in time before it (for some reason) dramatically exploded, now that you\'re in space a new threat arises **aliens**\n**How to play:** The goal is to get the highest score possible, move right or left then press ⏹ to shoot a laser, the higher your score the higher you\'ll be on the leaderboard\n\nif you get hit by get hit by an alien you\'ll loose a life (you have 3 lifes), goodluck!\n\nThis is you: 🚀\nThese are your bullets: 📍\nThese are aliens: 👾')
-
-async def scene_3(ctx):
-	"""Scene 3, played when you hit 50 score in spaceshooter"""
-	embed = discord.Embed(title='Chapter 3: The Crew', description='', color=discord.Color.dark_theme())
-	msg = await ctx.send(embed=embed)
-	embed.description += '**???**: *Hey, i didn\'t introduce myself*'
-	await msg.edit(embed=embed)
-	await asyncio.sleep(1)
-	embed.description += '\n**Caroline:** *My name is Caroline! what\'s your name?*'
-	await msg.edit(embed=embed)
-	await asyncio.sleep(1.5)
-	embed.description += f'\n**{ctx.author.display_name}:** *Oh, hello. My name is {ctx.author.display_name}*'
-	await msg.edit(embed=embed)
-	await asyncio.sleep(1.5)
-	embed.description += f'\n**Caroline:** *Very nice to meet you {ctx.author.name}*'
-	await msg.edit(embed=embed)
-	await asyncio.sleep(1.5)
-	embed.description += f'\n**{ctx.author.display_name}:** *Nice to meet you too.*'
-	await msg.edit(embed=embed)
-	await asyncio.sleep(1.5)
-	emojis = ['⬅','🏳','➡']
-	for emoji in emojis:
-		await msg.add_reaction(emoji)
-	return msg
-
-async def scene_4(ctx):
-	"""Scene 4, played when you use the maze command on storyline mode"""
-	embed = discord.Embed(title='Chapter 4: The Crash', description='', color=discord.Color.dark_theme())
-	msg = await ctx.send(embed=embed)
-	embed.description += '*Siren noises*\n**Raphael:** *EVERYBODY WAKE UP, WE NEED TO GO NOW*'
-	await msg.edit(embed=embed)
-	await asyncio.sleep(1.5)
-	embed.description += f'\n**{ctx.author.display_name}:** *WHAT\'S HAPPENING NOW???*'
-	await msg.edit(embed=embed)
-	await asyncio.sleep(2)
-	embed.description += f'\n**Raphael:** *THE SHIP GOT BADLEY DAMAGED, HERE EVERYONE TAKE THESE SUITS*'
-	await msg.edit(embed=embed)
-	await asyncio.sleep(2.5)
-	embed.description += f'\n**Caroline:** *OH NO!!!*\n**Adam:** *MY SHIP D:*'
-	await msg.edit(embed=embed)
-	await asyncio.sleep(2.5)
-	embed.description += '\n**Raphael:** *WE NEED TO GET ONTO THAT PLANET*'
-	await msg.edit(embed=embed)
-	await asyncio.sleep(1.5)
-	embed.description += f'\n**{ctx.author.display_name}:** *... okay we landed safely, what now*'
-	await msg.edit(embed=embed)
-	await asyncio.sleep(2)
-	embed.description += f'\n**Raphael:** *Be careful guys, this planet\'s gravity is really messed up*'
-	await msg.edit(embed=embed)
-	await asyncio.sleep(2)
-	embed.description += f'\n**Adam:** *crying*'
-	await msg.edit(embed=embed)
-	await ctx.send("__**Instructions:**__\nThis is you: :flushed:\nThese are walls: 🟥\nThis is an exit point: :x:\nThese are direction changer blocks: ⏫⏪⏩⏬ (changes the direction of the player to the direction it's pointing at)\nthis is a breaking block: 🔲 (it stops the player and breaks when he player touches it)\n\n**Part 3:** Now that you landed on the planet your goal is to hit the :x:, react to the reaction pointing in the direction you want to move. You will keep moving until you hit a wall be careful to not fall of the planet and as always, *goodluck!*")
-	await asyncio.sleep(1.5)
-	return msg
-
-async def scene_5(ctx):
-	embed = discord.Embed(title='chapter 5: The end', description=f'**{ctx.author.display_name}:** *Hmm, where am i... Where are the others, what even is this place*')
-	msg = await ctx.send(embed=embed)
-	await asyncio.sleep(2)
-	embed.description += '\n**???:** *IS ANYONE THERE*'
-	await msg.edit(embed=embed)
-	await asyncio.sleep(1.5)
-	embed.description += f'\n**{ctx.author.display_name}:** (in your mind) *... that sounds like Raphael, maybe i should say hi*'
-	await msg.edit(embed=embed)
-	await asyncio.sleep(1)
-	await ctx.send("Should you go meet Raphael or stay where you are?\n1. Yes\n2. No\n3. Wait a bit first")
-	msg = await bot.wait_for('message', check =  lambda m: m.author == ctx.author and m.channel == ctx.channel and m.content in ['1','2','3'])
-	return int(msg.content)
-
-async def credits(msg):
-	embed = msg.embeds[0]
-	embed.title = '**Credits**'
-	embed.color = discord.Color.blurple()
-	embed.description = f'Code created by: andreawthaderp#3031\nThank everyone that allowed me to make this bot and thank **you** for playing!'
-	await msg.edit(embed=embed)
-
-async def good_ending(ctx):
-	embed = discord.Embed(title="Good ending", description="**Caroline:**: *SHOOT HIM*", color=discord.Color.dark_theme())
-	msg = await ctx.send(embed=embed)
-	await asyncio.sleep(1.5)
-	embed.description += f'\n**{ctx.author.display_name}:** *(Shoots Raphael)*'
-	await msg.edit(embed=embed)
-	await asyncio.sleep(1)
-	embed.description += f'\n...'
-	await msg.edit(embed=embed)
-	await asyncio.sleep(1)
-	embed.description += f'\n...'
-	await msg.edit(embed=embed)
-	await asyncio.sleep(1)
-	embed.description += f'\n**You start loosing conscious and you somehow know that you will never wake up again, but you don\'t mind**'
-	await msg.edit(embed=embed)
-	await asyncio.sleep(3)
-	await credits(msg)
-
-async def bad_ending(ctx):
-	embed = discord.Embed(title="Bad ending", description="**Caroline:** *RUUUUUN*", color=discord.Color.dark_theme())
-	msg = await ctx.send(embed=embed)
-	await asyncio.sleep(2)
-	embed.description += '\n**Raphael:** *There is no where to run, Just give up and make this easy for the both of us*'
-	await msg.edit(embed=embed)
-	await asyncio.sleep(2)
-	embed.description += '\n**Raphael:** *(shoots you and Caroline)*'
-	await msg.edit(embed=embed)
-	await asyncio.sleep(2)
-	embed.description += '\n**Raphael:** *I didn\'t want to do this to you but you just had to force me*'
-	await msg.edit(embed=embed)
-	await asyncio.sleep(2.5)
-	embed.description += '\n*The world starts fading away, everything you did in your life, it all ends right here, you\'re filled with anger but there isn\'t much you could do*'
-	await msg.edit(embed=embed)
-	await asyncio.sleep(5)
-	await credits(msg)
-
-def back_home(ctx):
-	embed = discord.Embed(title='Going back home', description=f'**{ctx.author.display_name}:** *(shoots Rapheal)*', color=discord.Color.blurple())
-	msg = await ctx.send(embed=embed)
-	await asyncio.sleep(3)
-	embed.description += f'\n...'
-	msg = await ctx.send(embed=embed)
-	await asyncio.sleep(2)
-	embed.description += f'\n**Adam:** *Well that that\'s over, I think i could re-build the spaceship*'
-	msg = await ctx.send(embed=embed)
-	await asyncio.sleep(2)
-	embed.description += f'\n**Caroline:** *Where will we even go?*'
-	msg = await ctx.send(embed=embed)
-	await asyncio.sleep(2)
-	embed.description += f'\n**Adam:** *Home ofcourse*'
-	msg = await ctx.send(embed=embed)
-	await asyncio.sleep(1)
-	embed.description += f'\n**{ctx.author.display_name}:** *But earth exploded, don\'t you remember?*'
-	msg = await ctx.send(embed=embed)
-	await asyncio.sleep(3)
-	embed.description += f'\n**Adam:** *True, but it hasn\'t exploded in other univereses*'
-	msg = await ctx.send(embed=embed)
-	await asyncio.sleep(3)
-	embed.description += '\nYou, Caroline, and Adam start gathering scrap parts from around the planet and adam goes to work\n18 months later'
-	msg = await ctx.send(embed=embed)
-	await asyncio.sleep(2)
-	embed.description += f'\n**Adam:** *FINALLY, THE SPACESHIP IN ALL OF IT\'S GLORY*'
-	msg = await ctx.send(embed=embed)
-	await asyncio.sleep(2)
-	embed.description += f'\n*3.5 months of travelling later*'
-	msg = await ctx.send(embed=embed)
-	await asyncio.sleep(3)
-	embed.description += f'\n**{ctx.author.display_name}:** *OMG GUYS, WE FINALLT ARIVED*'
-	msg = await ctx.send(embed=embed)
-	await asyncio.sleep(3)
-	embed.description += f'\n**Caroline:** *I cannot believe it, after all this time*'
-	msg = await ctx.send(embed=embed)
-	await asyncio.sleep(3)
-	await credits(msg)
-
-async def betray_carolin(ctx):
-	embed = discord.Embed(title='Betray Caroline', description='**Bang Bang**', color=discord.Color.dark_theme())
-	msg = await ctx.send(embed=embed)
-	await asyncio.sleep(1.5)
-	embed.description += f'\n**Caroline:** *Whyyy*'
-	msg = await ctx.send(embed=embed)
-	await asyncio.sleep(1.5)
-	embed.description += f'\n**Raphael:** *Good job, knew you would take the right choice*'
-	msg = await ctx.send(embed=embed)
-	await asyncio.sleep(2.5)
-	embed.description += f'\n**Rapheal:** *gn (Raphael goes up to you and snaps your neck)*'
-	msg = await ctx.send(embed=embed)
-	await asyncio.sleep(2.5)
-	await credits(msg)
-
-async def rapheal_betrayel_2(ctx):
-	embed = discord.Embed(description=f"**{ctx.author.display_name}:** *Hmm, i think i am gonna stay away from Rapheal for now*")
-	msg = await ctx.send(embed=embed)
-	await asyncio.sleep(2)
-	embed.description += '\n**???:** *PST PSSST*'
-	await msg.edit(embed=embed)
-	await asyncio.sleep(2)
-	embed.description += f'\n**{ctx.author.display_name}:** *WHO\'S THERE... SHOW YOURSELF*'
-	await msg.edit(embed=embed)
-	await asyncio.sleep(2.5)
-	embed.description += f'\n**???:** *SHHHHH, you don\'t want him to hear you*'
-	await msg.edit(embed=embed)
-	await asyncio.sleep(2.5)
-	embed.description += f'\n**{ctx.author.display_name}:** *Who will hear me? who even are you*'
-	await msg.edit(embed=embed)
-	await asyncio.sleep(2.5)
-	embed.description += f'\n**???:** *It\'s me... Caroline*'
-	await msg.edit(embed=embed)
-	await asyncio.sleep(2.5)
-	embed.description += f'\n**{ctx.author.display_name}:** *Why are you hiding*'
-	await msg.edit(embed=embed)
-	await asyncio.sleep(2.5)
-	embed.description += f'\n**Caroline:** *I am hiding from Rapheal*'
-	await msg.edit(embed=embed)
-	await asyncio.sleep(1.5)
-	embed.description += f'\n**Caroline:** *He wants to kill us*'
-	await msg.edit(embed=embed)
-	await asyncio.sleep(2.5)
-	embed.description += f'\n*(in a distance) YOU MOTHERFUCKER... YOU\'RE THE REASON MY SHIP GOT DESTROYED*'
-	await msg.edit(embed=embed)
-	await asyncio.sleep(2.5)
-	embed.description += f'\n**Caroline:** *Oh no, Adam stands no chance against Raphael*'
-	await msg.edit(embed=embed)
-	await asyncio.sleep(2.5)
-	embed.description += f'\n**{ctx.author.display_name}:** *We should go and try to help him*'
-	await msg.edit(embed=embed)
-	await asyncio.sleep(1.5)
-	embed.description += f'\n**Caroline:** *...\n\nWe were too late, he is already dead*'
-	await msg.edit(embed=embed)
-	await asyncio.sleep(2.4)
-	embed.description += f'\n**Raphael:** *Well well well, would you look who it is*'
-	await msg.edit(embed=embed)
-	await asyncio.sleep(3)
-	embed.description += f'\n**Caroline:** *YOU WON\'T GET AWAY WITH WHAT YOU"VE DONE*'
-	await msg.edit(embed=embed)
-	await asyncio.sleep(2)
-	embed.description += f'\n**Raphael:** *And who is gonna stop me*'
-	await msg.edit(embed=embed)
-	await asyncio.sleep(2)
-	embed.description += f'\n**{ctx.author.display_name}:** *ME. WITH THE GUN YOU GAVE ME*'
-	await msg.edit(embed=embed)
-	await asyncio.sleep(2)
-	await ctx.send("Shoot Raphael with your gun? (You have 5 seconds to decide)\n1. Yes\n2. No\n3. ...")
-	try:
-		inp = await bot.wait_for('message', check=lambda m: m.author == ctx.author and m.channel == ctx.channel and m.content in ['1','2','3'], timeout=5)
-		inp = inp.content
-	except asyncio.TimeoutError:
-		inp = '3'
-	if inp == '1':
-		await good_ending(ctx)
-	else:
-		embed.description = '*Raphael Snatches the gun from your hands*'
-		await msg.edit(embed=embed)
-		await asyncio.sleep(2)
-		await bad_ending(ctx)
-
-async def caroline_and_adam(ctx):
-	embed = discord.Embed(description=f'**{ctx.author.display_name}:** *I will wait a bit*', color=discord.Color.blurple())
-	msg = await ctx.send(embed=embed)
-	await asyncio.sleep(2)
-	embed.description += '\n**???:** *PST PSSST*'
-	await msg.edit(embed=embed)
-	await asyncio.sleep(2)
-	embed.description += f"\n**???:** *It's us caroline and adam*"
-	await msg.edit(embed=embed)
-	await asyncio.sleep(2)
-	embed.description += f"\n**{ctx.author.display_name}:** *Why are you guys hiding?*"
-	await msg.edit(embed=embed)
-	await asyncio.sleep(2.5)
-	embed.description += f'\n**Caroline:** *We are hiding from Rapheal*'
-	await msg.edit(embed=embed)
-	await asyncio.sleep(1.5)
-	embed.description += f'\n**Caroline:** *He wants to kill us*'
-	await msg.edit(embed=embed)
-	await asyncio.sleep(2.5)
-	embed.description += f'**Adam:** *That motherfucker destroyed my ship on purpose*'
-	await msg.edit(embed=embed)
-	await asyncio.sleep(2.5)
-	embed.description += f'**{ctx.author.display_name}:** *So what should we do now*'
-	await msg.edit(embed=embed)
-	await asyncio.sleep(1.5)
-	embed.description += f'**Caroline:** *I say we all attack him at the same time*'
-	await msg.edit(embed=embed)
-	await asyncio.sleep(1.5)
-	embed.description += f'**Adam:** *Orrrr {ctx.author.display_name} could go fight him alobe considering he has the gun*'
-	await msg.edit(embed=embed)
-	await asyncio.sleep(2)
-	await ctx.send('Fight rapheal alone?\n1. Yes\n2. No')
-	try:
-		inp = await bot.wait_for('message', check=lambda m: m.author == ctx.author and m.channel == ctx.channel and m.content in ['1','2'], timeout=5)
-		inp = inp.content
-	except asyncio.TimeoutError:
-		inp = '1'
-	if inp == '1':
-		embed = discord.Embed(description=f'**{ctx.author.display_name}**: *Yea, Adam has a point*')
-		msg = await ctx.send(embed=embed)
-		embed.description += f'\n**Raphael:** *Oh {ctx.author.display_name} what are you doing there*'
-		for _ in range(3):
-			sword = list(random.choice(words))
-			word = sword
-			sword.shuffle()
-			sword = ''.join(sword)
-			await ctx.send(f'You have 5 seconds to unscramble the word {sword}')
-			try:
-				inp = await bot.wait_for('message', check=lambda m: m.author == ctx.author and m.channel == ctx.channel and m.content == ''.join(word), timeout=5)
-			except asyncio.TimeoutError:
-				pass
-			else:
-				return back_home(ctx)
-		return bad_ending(ctx)
-	else:
-		adam_alive = True
-		embed = discord.Embed(description=f'**{ctx.author.display_name}**: *Eh, i would rather not be alone against Raphael even with a gun*')
-		msg = await ctx.send(embed=embed)
-		await asyncio.sleep(2)
-		embed.description += f'\n**Raphael:** *Exactly, even with a gun you won\'t be able to scratch me*'
-		await asyncio.sleep(3)
-		for _ in range(5):
-			sword = list(random.choice(words))
-			word = sword
-			sword.shuffle()
-			sword = ''.join(sword)
-			await ctx.send(f'You have 5 seconds to unscramble the word {sword}')
-			try:
-				inp = await bot.wait_for('message', check=lambda m: m.author == ctx.author and m.channel == ctx.channel, timeout=5)
-			except asyncio.TimeoutError:
-				pass
-			else:
-				if inp.content == ''.join(word):
-					if adam_alive:
-						return back_home(ctx)
-					else:
-						return good_ending(ctx)
-				else:
-					if adam_alive:
-						embed.description += '\n*Raphael was able to snap adam\'s neck killing him instantly'
-						await msg.edit(embed=embed)
-
-		return bad_ending(ctx)
-
-async def rapheal_betrayel_1(ctx):
-	has_gun = True
-	embed = discord.Embed(description=f"**{ctx.author.display_name}:** *Raphael, is that you?*", color=discord.Color.dark_theme())
-	msg = await ctx.send(embed=embed)
-	await asyncio.sleep(2.5)
-	embed.description += f'\n**Raphael:** *Oh yes. {ctx.author.display_name}?*'
-	await msg.edit(embed=embed)
-	await asyncio.sleep(2.5)
-	embed.description += f'\n**{ctx.author.display_name}:** *Yea it\'s me, where are we?*'
-	await msg.edit(embed=embed)
-	await asyncio.sleep(2.5)
-	embed.description += f'\n**Raphael:** *I don\'t know, do you still have that gun i gave you?*'
-	await msg.edit(embed=embed)
-	await asyncio.sleep(2.5)
-	embed.description += f'\n**{ctx.author.display_name}:** *Yea, why?*'
-	await msg.edit(embed=embed)
-	await asyncio.sleep(1.75)
-	embed.description += f'\n**Raphael:** *Well you could give it to me now.*'
-	await msg.edit(embed=embed)
-	await ctx.send('Give rapheal your gun?\n1. Yes\n2. No')
-	inp = await bot.wait_for('message', check=lambda m: m.content in ['1','2'] and m.author == ctx.author and m.channel == ctx.channel)
-	if inp.content == '1':
-		has_gun = False
-		embed.description += f'\n**Raphael:** *Thank you, this will be useful lat-*'
-		await msg.edit(embed=embed)
-	else:
-		embed.description += f'\n**Raphael:** *What do you mean no? just give me th-*'
-		await msg.edit(embed=embed)
-	embed.description += f'\n**Adam:** *YOU MOTHERFUCKER... YOU\'RE THE REASON MY SHIP GOT DESTROYED*'
-	await msg.edit(embed=embed)
-	await asyncio.sleep(1.5)
-	embed.description += f'\n**Raphael:** *STAY RIGHT THERE*'
-	await msg.edit(embed=embed)
-	await asyncio.sleep(1.3)
-	embed.description += f'\n**Adam:** (charges at Raphael) *I AM GONNA KILL YOU*'
-	await msg.edit(embed=embed)
-	await asyncio.sleep(1.7)
-	if has_gun:
-		embed.description += f'\n**Raphael:** *SHOOT HIM*'
-		await ctx.send('Shoot Adam? (you have 8 seconds to decide)\n1. Yes\n2. No')
-		try:
-			inp = await bot.wait_for('message', check=lambda m: m.content in ['1','2'] and m.author == ctx.author and m.channel == ctx.channel, timeout=8)
-		except asyncio.TimeoutError:
-			inp = ctx.message
-			inp.content = '2'
-		if inp.content == '1':
-			embed.description += f'\n...'
-			await msg.edit(embed=embed)
-			await asyncio.sleep(1.3)
-			embed.description += '\n**Raphael:** *Thank you*'
-		else:
-			embed.description += f'\n**Raphael:** *WHAT ARE YOU DOING, SHOOT HIM ALREADY*'
-			await msg.edit(embed=embed)
-			await asyncio.sleep(1.5)
-			embed.description += f'\n**Raphael:** *(chokes Adam to death)*'
-			await msg.edit(embed=embed)
-			await asyncio.sleep(1.5)
-			embed.description += f'\n**Raphael:** *Thank you for nothing moron*'
-	else:
-		embed.description += f'\n**Raphael:** *(shoots Adam)*'
-	await msg.edit(embed=embed)
-	await asyncio.sleep(2.5)
-	embed = discord.Embed(description = f'\n**Raphael:** *Let\'s continue looking for Caroline, let\'s hope she doesn\'t go crazy like Adam*', color=discord.Color.dark_theme())
-	msg = await ctx.send(embed=embed)
-	await asyncio.sleep(3.5)
-	embed.description += f'\n**{ctx.author.display_name}:** *Hey, What about we split so we can cover more area*'
-	await msg.edit(embed=embed)
-	await asyncio.sleep(3.5)
-	embed.description += f'\n**Raphael:** *Good idea*'
-	await msg.edit(embed=embed)
-	await asyncio.sleep(3.5)
-	embed.description += f'\n**???:** *pst... pst... PST*'
-	await msg.edit(embed=embed)
-	await asyncio.sleep(2)
-	embed.description += f'\n**{ctx.author.display_name}:** *WHO\'S THERE*'
-	await msg.edit(embed=embed)
-	await asyncio.sleep(2)
-	embed.description += f'\n**???:** *SHHHHHH, don\'t let him hear you*'
-	await msg.edit(embed=embed)
-	await asyncio.sleep(2.5)
-	embed.description += f'\n**{ctx.author.display_name}:** *him? wha, who are you?*'
-	await msg.edit(embed=embed)
-	await asyncio.sleep(2.5)
-	embed.description += f'\n**Caroline:** *I am Caroline and i am talking about Raphael*'
-	await msg.edit(embed=embed)
-	await asyncio.sleep(3.5)
-	embed.description += f'\n**{ctx.author.display_name}:** *Oh Caroline, didn\'t recognize your voice*'
-	await msg.edit(embed=embed)
-	await asyncio.sleep(2.5)
-	embed.description += f'\n**{ctx.author.display_name}:** *Why do you not want Raphael to hear us? he\'s been searching for you*'
-	await msg.edit(embed=embed)
-	await asyncio.sleep(3.5)
-	embed.description += f'\n**Caroline:** *Do you seriously not see anything wrong with him killing Adam???*'
-	await msg.edit(embed=embed)
-	await asyncio.sleep(3.5)
-	embed.description += f'\n**{ctx.author.display_name}:** *I mean, Adam attacked him first*'
-	await msg.edit(embed=embed)
-	await asyncio.sleep(2.5)
-	embed.description += f'\n**Raphael:** *Good job, you found her!*'
-	await msg.edit(embed=embed)
-	await asyncio.sleep(2.5)
-	embed.description += f'\n**Caroline:** *STAY RIGHT THERE, DON\'T GET ANY CLOSER*'
-	await msg.edit(embed=embed)
-	await asyncio.sleep(3)
-	embed.description += f'\n**Raphael:** *Why would i do that*'
-	await msg.edit(embed=embed)
-	await asyncio.sleep(3)
-	if has_gun:
-		embed.description += f'\n**{ctx.author.display_name}:** *Because i have the gun*'
-		await msg.edit(embed=embed)
-		await asyncio.sleep(3)
-		embed.description += f'\n**Raphael:** *You wouldn\'t have the guts*'
-		await msg.edit(embed=embed)
-		await asyncio.sleep(3)
-		embed.description += f'\n**Caroline:** *SHOOT HIM, HE CRASHED THE SHIP ON PURPOSE*'
-		await msg.edit(embed=embed)
-		await asyncio.sleep(2.5)
-		embed.description += f'\n**Caroline:** *HE WANTS TO KILL US*'
-		await msg.edit(embed=embed)
-		await asyncio.sleep(2.5)
-		await ctx.send("Shoot Raphael? (You have 5 seconds to decide)\n1. Yes\n2. Shoot Caroline instead\n3. ...")
-		try:
-			inp = await bot.wait_for('message', check=lambda m: m.author == ctx.author and m.channel == ctx.channel and m.content in ['1','2','3'], timeout=5)
-			inp = inp.content
-		except asyncio.TimeoutError:
-			inp = '3'
-		if inp == '1':
-			await good_ending(ctx)
-		elif inp == '2':
-			await betray_carolin(ctx)
-		else:
-			embed.description += '\n**Rapheal:** *Knew you wouldn\'t dare, Now give me the gun before someone gets hurt*'
-			await msg.edit(embed=embed)
-			await asyncio.sleep(3)
-			embed.description += f'\n**{ctx.author.display_name}:** *Explain yourself first*'
-			await msg.edit(embed=embed)
-			await asyncio.sleep(3)
-			embed.description += f'\n**Raphael:** *I SAID GIVE ME THE GUN* (Starts running at you)'
-			await msg.edit(embed=embed)
-			await asyncio.sleep(2.5)
-			await ctx.send("Shoot Raphael? (You have 3 second to decide)\n1. Yes\n2. ...")
+		await asyncio.sleep(renderer.interval) # one frame per edit so none of them get dropped
+
+@story.hook('unscramble')
+async def unscramble(playback, rounds, adam=False):
+	"""Fighting Raphael, the player has to unscramble one of the words in time. If Adam fights too he dies on the first wrong answer"""
+	ctx = playback.ctx
+	adam_alive = adam
+	for _ in range(rounds):
+		word = random.choice(words)
+		scrambled = ''.join(random.sample(word, len(word)))
+		with router.messages(ctx.channel, ctx.author, check=lambda m: adam or m.content.lower() == word) as inputs:
+			await ctx.send(f'You have 5 seconds to unscramble the word {scrambled}')
 			try:
-				inp = await bot.wait_for('message', check=lambda m: m.author == ctx.author and m.channel == ctx.channel and m.content in ['1','2','3'], timeout=3)
-				inp = inp.content
+				inp = await inputs.get(timeout=5)
 			except asyncio.TimeoutError:
-				inp = '2'
-			if inp == '1':
-				await good_ending(ctx)
-			elif inp == '2':
-				await bad_ending(ctx)
-	else:
-		embed.description += '\n**Raphael:** *Guess who has the gun* (he says with a smug grin)'
-		await msg.edit(embed=embed)
-		await asyncio.sleep(3)
-		await bad_ending(ctx)
+				continue
+		if inp.content.lower() == word:
+			return 'good_ending' if adam and not adam_alive else 'back_home'
+		if adam_alive:
+			adam_alive = False
+			await playback.say("*Raphael was able to snap adam's neck killing him instantly*")
+	return 'bad_ending'
 
-def get_player(lst):
-	"""Returns the x, y coordinates of the player on the board"""
-	for x, row in enumerate(lst):
-		for y, column in enumerate(row):
-			if column == 'p':
-				return x, y
 
-def go_direction(lst, direction, player_index):
-	"""Moves the player into a direction and makes sure the player isn't in an infinite loop/off screen"""
-	x, y = player_index
-	moves = 0
-	while True:
-		moves += 1
-		x += direction[0]
-		y += direction[1]
-		if x < 0 or y < 0:
-			return None, "Dead"
-		try:
-			if lst[x][y] == 'w':
-				x -= direction[0]
-				y -= direction[1]
-				break
-			elif lst[x][y] == 'u':
-				x -= direction[0]
-				y -= direction[1]
-				direction = UP
-			elif lst[x][y] == 'd':
-				x -= direction[0]
-				y -= direction[1]
-				direction = DOWN
-			elif lst[x][y] == 'l':
-				x -= direction[0]
-				y -= direction[1]
-				direction = LEFT
-			elif lst[x][y] == 'r':
-				x -= direction[0]
-				y -= direction[1]
-				direction = RIGHT
-			elif lst[x][y] == 'b':
-				lst[x][y] = 'g'
-				x -= direction[0]
-				y -= direction[1]
-				break
-		except IndexError:
-			return None, "Dead"
-		if moves > 150:
-			return 'Infinite loop', "Dead"
-	return lst, x, y
-
-def save_maze(maze):
-	"""Saves the player made maze, only saves it if the player was able to beat it to prove that the maze was actually possible"""
-	if not 'levels.txt' in os.listdir():
-		f = open('levels.txt', mode='x')
-		f.write(maze+'\n')
-	else:
-		f = open('levels.txt', mode='a')
-		f.write(maze+'\n')
+async def storyline_levels():
+	"""The storyline mazes, an async iterator like the user made mazes so both can be played by the same loop"""
+	for level in storyline_mazes:
+		yield level
 
 async def score_db():
-	"""Creates "scores.db" which saves the scores for the leaderboard command"""
+	"""Creates "scores.db" which saves the scores for the leaderboard command, the storyline progress, the user made mazes and the replays of the best scores"""
 	await bot.wait_until_ready()
-	bot.db = await aiosqlite.connect('scores.db')
-	await bot.db.execute("CREATE TABLE IF NOT EXISTS scores (author_id int, score int, command_name text)")
-
-async def save_score(ctx, score):
-	"""Adds the player score into scores.db"""
-	cursor = await bot.db.execute("SELECT score from scores WHERE author_id = ? AND command_name = ?", (ctx.author.id, ctx.command.name))
-	data = await cursor.fetchone()
-	if data:
-		if data[0] < score:
-			await bot.db.execute(f"UPDATE scores SET score = ? WHERE author_id = ? AND command_name = ?", (score, ctx.author.id, ctx.command.name))
-	else:
-		await bot.db.execute("INSERT OR IGNORE INTO scores (author_id, score, command_name) VALUES (?,?,?)", (ctx.author.id, score, ctx.command.name))
-	await bot.db.commit()
+	bot.db, bot.scores, bot.progress, bot.mazes, bot.replays = await storage.connect('scores.db')
+	bot.loop.create_task(bot.scores.run())
+	bot.loop.create_task(bot.replays.run())
+	bot.loop.create_task(bot.progress.run())
+
+def score_name(command):
+	"""The game the scores of a command are saved under, a subcommand like speed lobby counts for its group"""
+	return (command.root_parent or command).name
+
+def save_score(ctx, score, session=None, player_id=None):
+	"""Adds the player score into scores.db, it gets written with the next batch so the game doesn't wait for the database. The replay log of the game goes with the score of the player who started it"""
+	session = session or sessions.sessions.get(ctx.message.id)
+	player_id = player_id or ctx.author.id
+	with metrics.timer('save_score_seconds'):
+		bot.scores.save(player_id, score_name(ctx.command), score)
+		if session and session.replay and player_id == ctx.author.id:
+			bot.replays.save(player_id, score_name(ctx.command), score, session.replay.finish())
+
+def save_scores(ctx, session=None):
+	"""save_score for every player of a speed game"""
+	session = session or sessions.sessions.get(ctx.message.id)
+	for player_id, score in session.state.scores.items():
+		save_score(ctx, score, session, player_id)
+
+async def close_db():
+	if not hasattr(bot, 'db'): # never got ready
+		return
+	await bot.scores.flush()
+	await bot.replays.flush()
+	await bot.db.close()
 
 def storyline_check():
-	def predicate(ctx):
-		try:
-			if len(cache[str(ctx.author.id)]) >= 3: # it shouldn't be more than 3 but this is just in case it somehow is
-				return True
-		except KeyError:
-			pass
-		return False
+	async def predicate(ctx):
+		return await bot.progress.finished(ctx.author.id)
 	return commands.check(predicate)
 
-# zombies board
-board = [
-['g','g','g','g','q','G','q','g','g','g','g'],
-['g','g','g','g','q','G','q','g','g','g','g'],
-['g','g','g','g','q','G','q','g','g','g','g'],
-['g','g','g','g','q','G','q','g','g','g','g'],
-['q','q','q','q','q','G','q','q','q','q','q'],
-['G','G','G','G','G','p','G','G','G','G','G'],
-['q','q','q','q','q','G','q','q','q','q','q'],
-['g','g','g','g','q','G','q','g','g','g','g'],
-['g','g','g','g','q','G','q','g','g','g','g'],
-['g','g','g','g','q','G','q','g','g','g','g'],
-['g','g','g','g','q','G','q','g','g','g','g'],
-]
+@bot.before_invoke
+async def open_session(ctx):
+	if ctx.command.qualified_name in sessions.games:
+		sessions.open(ctx)
+	metrics.command_started(ctx) # after the session limits, the after invoke hook doesn't run for a command they stopped
+
+@bot.after_invoke
+async def close_session(ctx):
+	metrics.command_finished(ctx, ctx.command_failed)
+	session = sessions.close(ctx)
+	if session and session.reaped:
+		if hasattr(session.state, 'scores'):
+			save_scores(ctx, session)
+		elif session.score() is not None:
+			save_score(ctx, session.score(), session)
+		await ctx.send(f"{ctx.author.mention} Ended your {ctx.command.name} game, nothing happened for {sessions.idle_timeout} seconds")
 
 @bot.event
 async def on_ready():
@@ -807,223 +205,129 @@ async def on_ready():
 
 @bot.command()
 async def zombies(ctx):
-	"""You're surrounded by zombies!!! don't worry tho, you have a gun. React to the reaction pointing in the direction you want *don't miss*"""
-	board_copy = copy.deepcopy(board)
-	update_cache(ctx)
-
-	bullets = []
-	zombies = []
-	score = 0
-	alive = True
-
-	msg = await ctx.send(embed=discord.Embed(title='Chapter 1: What happened', color=discord.Color.dark_theme()))
-	await scene_1(ctx, msg)
-	emojis = ['⬆','⬅','➡','⬇','🏳']
-	for emoji in emojis:
-		await msg.add_reaction(emoji)
-	while True:
-		await msg.edit(content=f"Score: {score}\n", embed=discord.Embed(title='Zombies', description=format_board(board_copy), color=discord.Color.blurple()))
-		if not len(bullets) == 5:
-			try:
-				inp, _ = await bot.wait_for('reaction_add', check = lambda r,u: str(r) in emojis and u == ctx.author and r.message == msg, timeout=3.5)
-				try:
-					await msg.remove_reaction(str(inp), ctx.author)
-				except discord.Forbidden:
-					pass
-				if str(inp) == '🏳':
-					await save_score(ctx, score)
+	"""You're surrounded by zombies!!! don't worry tho, you have a gun. Press the button pointing in the direction you want *don't miss*"""
+	seed = sessions.seed(ctx)
+	state = ZombiesState(seed=seed)
+	replay = Recorder(state, seed)
+	view = BoardRenderer()
+	sessions.attach(ctx, state, replay=replay)
+	instant = await bot.progress.played(ctx.author.id, ctx.command.name)
+	await update_cache(ctx)
+
+	msg = await story.play(ctx, 'scene_1', instant=instant)
+	controls = Controls(router, renderer, [ctx.author], ['⬆','⬅','➡','⬇','🏳'])
+	controls.attach(msg)
+	with controls as inputs:
+		while True:
+			renderer.submit(msg, content=f"Score: {state.score}\n", embed=discord.Embed(title='Zombies', description=view.render(state.render()), color=discord.Color.blurple()))
+			await clock.sleep(3.5)
+			directions = []
+			for inp in inputs.drain():
+				if inp == '🏳':
+					save_score(ctx, state.score)
 					return await ctx.send('Ended the game!')
-				bullets.append(Bullet(conversion[str(inp)], [5,5]))
-			except asyncio.TimeoutError:
-				pass
-		for bullet in bullets:
-			board_copy[bullet.index[0]][bullet.index[1]] = 'G'
-			try:
-				bullet.move()
-				if bullet.index[0] < 0:
-					bullets.remove(bullet)
-					continue
-				board_copy[bullet.index[0]][bullet.index[1]] = 'L'
-			except IndexError:
-				bullets.remove(bullet)
-		board_copy, bullets, zombies, score = check_zombie_collides(board_copy, bullets, zombies, score)
-		for zombie in zombies:
-			try:
-				board_copy[zombie.index[0]][zombie.index[1]] = 'G'
-			except IndexError:
-				pass
-			zombie.move()
-			board_copy[zombie.index[0]][zombie.index[1]] = 'z'
-			if zombie.index == [5,5]:
-				await save_score(ctx, score)
-				return await ctx.send(f"The zombie ate {ctx.author.display_name}'s brain!!!\n\nScore: {score}")
-		board_copy[5][5] = 'p'
-		if len(zombies) < 5:
-			zombie_number = random.choice([0,0,0,0,1,1,1,2,2,3])
-			directions_copy = copy.copy(directions)
-			for i in range(zombie_number):
-				direction = random.choice(directions_copy)
-				zombies.append(Zombie(direction))
-				directions_copy.remove(direction)
+				directions.append(conversion[inp])
+			replay.tick(directions)
+			with metrics.timer('tick_seconds', game='zombies'):
+				tick(state, directions)
+			if state.over:
+				save_score(ctx, state.score)
+				return await ctx.send(f"The zombie ate {ctx.author.display_name}'s brain!!!\n\nScore: {state.score}")
 
 @bot.command()
 async def spaceshooter(ctx):
 	"""You're in a spaceship now. move the spaceship to avoid and shoot at the aliens for score and make sure to net get hit"""
-	update_cache(ctx)
-	msg = await ctx.send(embed=discord.Embed(title='Chapter 2: The spaceship', color=discord.Color.dark_theme()))
-	await scene_2(ctx, msg)
-	bord = [['g']*5 for i in range(7)]
-	emojis = ['⬅','🏳','➡']
-	for emoji in emojis:
-		await msg.add_reaction(emoji)
-	index = 2
-	bullets = []
-	aliens = []
-	lifes = 3
-	bullet_limit = 5
-	score = 0
-	bord_copy = copy.deepcopy(bord)
-	bord_copy[6][index] = 's'
+	instant = await bot.progress.played(ctx.author.id, ctx.command.name)
+	await update_cache(ctx)
+	msg = await story.play(ctx, 'scene_2', instant=instant)
+	controls = Controls(router, renderer, [ctx.author], ['⬅','🏳','➡'])
+	controls.attach(msg)
+	seed = sessions.seed(ctx)
+	state = SpaceshooterState(seed=seed)
+	replay = Recorder(state, seed)
+	view = BoardRenderer()
+	sessions.attach(ctx, state, replay=replay)
 	scene_3_done = False 
-	while True:
-		bord_copy = copy.deepcopy(bord)
-		if score >= 30 and not scene_3_done:
-			msg = await scene_3(ctx)
-			scene_3_done = True
-		try:
-			inp, _ = await bot.wait_for('reaction_add', check = lambda r,u: str(r) in emojis and u == ctx.author and r.message == msg, timeout=2.5)
-			try:
-				await msg.remove_reaction(str(inp), ctx.author)
-			except discord.Forbidden:
-				pass
-			if str(inp) == '⬅':
-				if not len(bullets) == bullet_limit:
-					bullets.append(Bullet(UP, [6, index]))
-				index -= 1
-				if index < 0:
-					index = len(bord_copy[0])-1
-			elif str(inp) == '➡':
-				if not len(bullets) == bullet_limit:
-					bullets.append(Bullet(UP, [6, index]))
-				index += 1
-				if index == len(bord_copy[0]):
-					index = 0
-			elif str(inp) == '🏳':
-				await ctx.send('Ended the game!')
-				await save_score(ctx, score)
-				return
-		except asyncio.TimeoutError:
-			if not len(bullets) == bullet_limit:
-				bullets.append(Bullet(UP, [6, index]))
-
-		for bullet in bullets:
-			bullet.move()
-			if bullet.index[0] < 0:
-				bullets.remove(bullet)
-				continue
-			bord_copy[bullet.index[0]][bullet.index[1]] = 'L'
-
-		if random.randint(1, 10) >= 5 and len(aliens) <= 5:
-			for _ in range(random.randrange(1,3)):
-				alien = Alien()
-				while alien.index in [a.index for a in aliens]:
-					alien = Alien()
-				aliens.append(alien)
-
-		for alien in aliens:
-			continue_ = False
-			for bullet in bullets:
-				if bullet.index == alien.index or [bullet.index[0]+bullet.direction[0], bullet.index[1]+bullet.direction[1]] == alien.index:
-					bord_copy[bullet.index[0]][bullet.index[1]] = 'g'
-					bullets.remove(bullet)
-					aliens.remove(alien)
-					continue_ = True
-					score += 1
-					break
-			if continue_:
-				continue
-			alien.move()
-			if alien.index == [6, index]:
-				lifes -= 1
-				await ctx.send(f"You have {lifes} lifes left")
-				aliens.remove(alien)
-				if lifes <= 0:
-					await save_score(ctx, score)
-					return await ctx.send(f"You don't have any more lifes!!!\n\nScore: {score}")
-				continue
-			elif alien.index[0] == len(bord_copy):
-				aliens.remove(alien)
-				continue
-			bord_copy[alien.index[0]][alien.index[1]] = 'a'
-		bord_copy[6][index] = 's'
-		embed = discord.Embed(title='Aliens', description=format_board(bord_copy), color=discord.Color.blurple())
-		await msg.edit(content=f"Score: {score}", embed=embed)
+	with controls as inputs:
+		while True:
+			if state.score >= 30 and not scene_3_done:
+				msg = await story.play(ctx, 'scene_3', instant=instant)
+				controls.attach(msg)
+				scene_3_done = True
+			await clock.sleep(2.5)
+			directions = []
+			for inp in inputs.drain():
+				if inp == '🏳':
+					await ctx.send('Ended the game!')
+					save_score(ctx, state.score)
+					return
+				directions.append(conversion[inp])
+			replay.tick(directions)
+			with metrics.timer('tick_seconds', game='spaceshooter'):
+				tick(state, directions)
+			if state.hit:
+				await ctx.send(f"You have {state.lifes} lifes left")
+			if state.over:
+				save_score(ctx, state.score)
+				return await ctx.send(f"You don't have any more lifes!!!\n\nScore: {state.score}")
+			embed = discord.Embed(title='Aliens', description=view.render(state.render()), color=discord.Color.blurple())
+			renderer.submit(msg, content=f"Score: {state.score}", embed=embed)
 
 @bot.group(invoke_without_command=True)
-async def maze(ctx, mode='storyline'):
-	"""good and bad news, the bad news are that the spaceship is now destroyed the good news you're all on a planet with your space suits, the planet's gravity is messed up tho. Try to get to the :x: in the storyline mode" or play user made mazes in the usermade mode"""
+async def maze(ctx, mode='storyline', difficulty:int=None):
+	"""good and bad news, the bad news are that the spaceship is now destroyed the good news you're all on a planet with your space suits, the planet's gravity is messed up tho. Try to get to the :x: in the storyline mode" or play user made mazes in the usermade mode, optionally only the ones of a difficulty from 1 to 5"""
 	msg = None
-	emojis = ['⬆','⬅','➡','⬇','🏳']
+	controls = Controls(router, renderer, [ctx.author], ['⬆','⬅','➡','⬇','🏳'])
 	if mode.lower() not in ['storyline', 'usermade']:
 		return await ctx.send(f'{mode} isn\'t a valid mode, available modes: "storyline"/"usermade"')
 	elif mode.lower() == 'storyline':
-		mazes = ["wwwwwwwwww\nwp wx    w\nw        w\nwwwwwwwwww\n", "wwwwwwwwww\nwp wx    w\nw        w\nw wwwwwwww\n","w wwwwwwww\nwpw      w\nw w wwww w\nw w w  w w\nw w wx w w\nw w ww w w\nw w    w w\nw wwwwww w\nw        w\nwwwwwwwwww\n","ww        ww\nwp         w\n            \nww          \n          ww\n          xw\n  w         ","ww    www\nwp     ww\n         \n       ww\nww wx   w\nw       w\nw        \nw      ww\nww    www","wwwwwwww\nwp w   w\nw      w\nw      w\nww     w\nw   x  w\nw   w  w\n        ","wwwwwww\nwp    w\nw     w\nwbwwwbw\nw     w\nw    xw\nwwwwwww","    w       \nwpw        w\n     wwww   \n     w      \n            \n     wxw    \nw    www    \n w        ww","wwwwwlw\nwdd   w\ndpdx  w\nw www w\nw     u\nwrwwwww","wpw wwwwwwwwwww\nw u       ww   \nw www  ww ww  w\nw      ww ww  w\nwwwwwwwww ww  w\nww      w ww  w\nw  lw          \n    www wwwwwww\nw   wwx       w\nwwwwwww       w\n              w\n        wwwww w\nw              \nww     wwwwwwrw"]
-		msg = await scene_4(ctx)
-		for emoji in emojis:
-			await msg.add_reaction(emoji)
+		mazes = storyline_levels()
+		msg = await story.play(ctx, 'scene_4', instant=await bot.progress.played(ctx.author.id, 'maze'))
+		controls.attach(msg)
 	else:
-		try:
-			f = open('levels.txt', mode='r')
-		except FileNotFoundError:
-			return await ctx.send(f"No user made mazes :pensive:. You could be the first tho, use the `{ctx.prefix}maze add` command!")
-		mazes = f.readlines()
-		mazes = [maze[:-1] for maze in mazes]
-		random.shuffle(mazes)
+		if not await bot.mazes.count(difficulty):
+			return await ctx.send(f"No user made mazes{f' of difficulty {difficulty}' if difficulty else ''} :pensive:. You could be the first tho, use the `{ctx.prefix}maze add` command!")
+		mazes = bot.mazes.shuffled(difficulty, random.Random(sessions.seed(ctx)))
 	usermade = False if mode.lower() == 'storyline' else True
-	for maze in mazes:
-		lst = []
-		for line in maze.split(r'\n' if usermade else '\n'):
-			lst.append(list(line))
-		embed = discord.Embed(title='Maze', description=format_board(lst), color=discord.Color.blurple())
-		if msg:
-			await msg.edit(embed=embed)
-		else:
-			msg = await ctx.send(embed=embed)
-			for emoji in emojis:
-				await msg.add_reaction(emoji)
-		while True:
-			await msg.edit(embed = discord.Embed(title='Maze', description=format_board(lst), color=discord.Color.blurple()))
-			inp, _ = await bot.wait_for('reaction_add', check = lambda r, u: str(r) in emojis and u == ctx.author and r.message == msg)
-			try:
-				await msg.remove_reaction(str(inp), ctx.author)
-			except discord.Forbidden:
-				pass
-			x, y = get_player(lst)
-			lst[x][y] = ' '
-			if str(inp) == '🏳':
-				return await ctx.send('Ended the game!')
-			lst, x, y = go_direction(lst, conversion[str(inp)], (x, y))
-			if x == None:
-				embed = discord.Embed(title='Maze', description=format_board(lst), color=discord.Color.blurple())
-				await msg.edit(embed=embed)
-				return await ctx.send("You died")
-			if lst[x][y] == 'x':
-				lst[x][y] = 'p'
-				await ctx.send("You won!", delete_after=5)
-				embed = discord.Embed(title='Maze', description=format_board(lst), color=discord.Color.blurple())
-				await msg.edit(embed=embed)
-				await asyncio.sleep(1)
-				break
-			lst[x][y] = 'p'
+	view = BoardRenderer()
+	with controls as inputs:
+		async for maze in mazes:
+			state = MazeState(maze)
+			sessions.attach(ctx, state)
+			embed = discord.Embed(title='Maze', description=view.render(state.render()), color=discord.Color.blurple())
+			if msg:
+				renderer.submit(msg, embed=embed)
+			else:
+				msg = await ctx.send(embed=embed, view=controls)
+				metrics.shown(ctx)
+				controls.attach(msg, edit=False)
+			while True:
+				renderer.submit(msg, embed=discord.Embed(title='Maze', description=view.render(state.render()), color=discord.Color.blurple()))
+				inp = await inputs.get()
+				if inp == '🏳':
+					return await ctx.send('Ended the game!')
+				with metrics.timer('tick_seconds', game='maze'):
+					step_maze(state, conversion[inp])
+				if state.won:
+					await ctx.send("You won!", delete_after=5)
+					embed = discord.Embed(title='Maze', description=view.render(state.render()), color=discord.Color.blurple())
+					renderer.submit(msg, embed=embed)
+					await asyncio.sleep(1)
+					break
+				if state.over:
+					embed = discord.Embed(title='Maze', description=view.render(state.render()), color=discord.Color.blurple())
+					renderer.submit(msg, embed=embed)
+					await renderer.flush(msg)
+					return await ctx.send("You died")
 	if not usermade:
-		update_cache(ctx)
+		await update_cache(ctx)
 
 @maze.command()
 async def add(ctx, *, maze):
 	"""A way to add your very own maze"""
 	maze = maze.lower()
 	if maze.startswith('```') and maze.endswith('```'):
-		maze = '\n'.join(maze.split('\n')[1:])[:3]
+		maze = '\n'.join(maze.split('\n')[1:])[:-3]
 	if 'p' not in maze:
 		return await ctx.send("There is no player")
 	elif 'x' not in maze:
@@ -1043,102 +347,114 @@ async def add(ctx, *, maze):
 		lst.append(list(line))
 	if len(lst) < 3 or len(lst[0]) < 3:
 		return await ctx.send("The maze must be atleast 3x3 big")
+	origin = '\n'.join([''.join(i) for i in lst])
 	embed = discord.Embed(title='Maze', description=format_board(lst), color=discord.Color.blurple())
-	try:
-		msg = await ctx.send(embed=embed)
-	except discord.HTTPException:
+	if len(embed.description) > 4096:
 		return await ctx.send(f"The maze is too big ({len(embed.description)}/4096)")
-	emojis = ['⬆','⬅','➡','⬇','🏳']
-	for emoji in emojis:
-		await msg.add_reaction(emoji)
-	origin_lst = copy.deepcopy(lst)
-	while True:
-		await msg.edit(embed = discord.Embed(title='Maze', description=format_board(lst), color=discord.Color.blurple()))
-		inp, _ = await bot.wait_for('reaction_add', check = lambda r, u: str(r) in emojis and u == ctx.author and r.message == msg)
-		try:
-			await msg.remove_reaction(str(inp), ctx.author)
-		except discord.Forbidden:
-			pass
-		lst, x, y = get_player(lst)
-		lst[x][y] = ' '
-		if str(inp) == '🏳':
-			return await ctx.send('Ended the game!')
-		x, y = go_direction(lst, conversion[str(inp)], (x, y))
-		if x == None or isinstance(x, str):
-			embed = discord.Embed(title='Maze', description=format_board(lst), color=discord.Color.blurple())
-			await msg.edit(embed=embed)
-			return await ctx.send("You died!")
-		if lst[x][y] == 'x':
-			lst[x][y] = 'p'
-			await ctx.send("You won! *saving maze*")
-			save_maze(r'\n'.join([''.join(i) for i in origin_lst]))
-			embed = discord.Embed(title='Maze', description=format_board(lst), color=discord.Color.blurple())
-			await msg.edit(embed=embed)
-			await asyncio.sleep(1)
-			break
-		lst[x][y] = 'p'
-
-@bot.command()
-async def speed(ctx, member:discord.Member=None):
-	"""A simple game where you have 5 seconds to send the coordinates of the colored circles, if a member is selected it's a race to 30 points, otherwise it goes on until you send "end"/"stop"/"cancel\""""
-	if member:
-		if member.bot or member == ctx.author:
-			member = None
-			score = 0
-		else:
-			scores = {ctx.author:0,member:0}
+	try:
+		min_moves, difficulty = await asyncio.to_thread(rate, origin) # solving it here means the author doesn't have to beat his own maze first, in a thread so the other games don't wait for it
+	except TooComplex:
+		return await ctx.send("This maze has too many ways to play it to be checked, try a smaller one or fewer breaking blocks")
+	if min_moves is None:
+		return await ctx.send("This maze can't be beaten, make sure the exit point can be reached")
+	embed.set_footer(text=f'Shortest solution: {min_moves} moves | Difficulty: {difficulty}/5')
+	if await bot.mazes.add(origin, min_moves, difficulty):
+		await ctx.send("*saving maze*", embed=embed)
 	else:
-		score = 0
+		await ctx.send("This maze was already added", embed=embed)
 
-	board = [['g']*5 for _ in range(5)]
-	e = discord.Embed(title='Speed', description=(f"{ctx.author.display_name} score: {scores[ctx.author]} | {member.display_name} score: {scores[member]}" if member else f"Score: {score}")+'\n'+format_speed_board(board), color=discord.Color.blurple())
-	msg = await ctx.send(embed=e)
-	while True:
-		board_copy = copy.deepcopy(board)
-		board_copy = summon_blocks(board_copy)
-		e = discord.Embed(title='Speed', description=(f"{ctx.author.display_name} score: {scores[ctx.author]} | {member.display_name} score: {scores[member]}" if member else f"Score: {score}")+'\n'+format_speed_board(board_copy), color=discord.Color.blurple())
-		await msg.edit(embed=e)
+async def delete_answers(channel, messages):
+	"""Deletes the answers of a speed round with one bulk delete request per 100 messages (the most one request takes), the next round doesn't wait for it
+
+	It runs as a task nobody awaits, so every error is handled here"""
+	for start in range(0, len(messages), 100):
 		try:
-			inp = await bot.wait_for('message', check = lambda m: m.author in [ctx.author, member] and m.channel == ctx.channel, timeout=5)
-		except asyncio.TimeoutError:
+			await channel.delete_messages(messages[start:start+100])
+		except discord.HTTPException: # no manage messages permission, someone else deleted one already, discord having a bad day
 			pass
-		else:
-			if inp.content.lower() in ['end','stop','cancel']:
-				await ctx.send("Stopped the game!")
-				return await save_score(ctx, score)
+
+@bot.group(invoke_without_command=True)
+async def speed(ctx, member:Optional[discord.Member]=None, size:int=5):
+	"""A simple game where you have 5 seconds to send the coordinates of the colored circles, if a member is selected it's a race to 30 points, otherwise it goes on until you send "end"/"stop"/"cancel". The board is 5x5 unless you pick a size from 3 to 10\""""
+	if not SpeedState.min_size <= size <= SpeedState.max_size:
+		return await ctx.send(f"The board can be {SpeedState.min_size}x{SpeedState.min_size} to {SpeedState.max_size}x{SpeedState.max_size} big")
+	if member and (member.bot or member == ctx.author):
+		member = None
+	players = [ctx.author, member] if member else [ctx.author]
+	await play_speed(ctx, players, size, goal=30 if member else None)
+
+@speed.command()
+@commands.guild_only()
+async def lobby(ctx, size:int=5):
+	"""A speed game for the whole channel, everyone who presses join in the next 30 seconds plays on the same board and the first to 30 points wins"""
+	if not SpeedState.min_size <= size <= SpeedState.max_size:
+		return await ctx.send(f"The board can be {SpeedState.min_size}x{SpeedState.min_size} to {SpeedState.max_size}x{SpeedState.max_size} big")
+	waiting = Lobby(renderer, ctx.author, discord.Embed(title=f'Speed lobby of {ctx.author.display_name}', color=discord.Color.blurple()))
+	msg = await ctx.send("Press join to play, the game starts in 30 seconds or when the host presses start", embed=waiting.embed, view=waiting)
+	metrics.shown(ctx)
+	players = await waiting.wait_for_start(msg, 30)
+	await play_speed(ctx, players, size, goal=30, lobby=True)
+
+async def play_speed(ctx, players, size, goal, lobby=False):
+	"""The rounds of a speed game, one message and one edit per round however many players there are. Only the host can stop a lobby game"""
+	seed = sessions.seed(ctx)
+	state = SpeedState([player.id for player in players], goal=goal, size=size, seed=seed)
+	replay = Recorder(state, seed)
+	sessions.attach(ctx, state, players, replay)
+	names = {player.id: player.display_name for player in players}
+
+	def scoreboard():
+		if len(players) == 1:
+			return f"Score: {state.scores[ctx.author.id]}"
+		if len(players) == 2:
+			return ' | '.join(f"{names[player_id]} score: {score}" for player_id, score in state.scores.items())
+		ranking = sorted(state.scores.items(), key=lambda entry: entry[1], reverse=True)
+		lines = [f"**{index}.** {names[player_id]}: {score}" for index, (player_id, score) in enumerate(ranking[:10], start=1)]
+		if len(ranking) > 10:
+			lines.append(f"*and {len(ranking)-10} more*")
+		return '\n'.join(lines)
+
+	def stops(inp):
+		return inp.content.lower() in ['end','stop','cancel'] and (not lobby or inp.author.id == ctx.author.id)
+
+	def counts(inp):
+		"""Only answers and stops end a round, the players can still chat"""
+		return stops(inp) or next(convert(inp.content, size), None) is not None
+
+	e = discord.Embed(title='Speed', description=scoreboard()+'\n'+format_speed_board(state.render(), state.blocks), color=discord.Color.blurple())
+	msg = await ctx.send(embed=e)
+	metrics.shown(ctx)
+	with router.messages(ctx.channel, *players, check=counts) as inputs:
+		while True:
 			try:
-				await inp.delete()
-			except discord.Forbidden:
-				pass
-			coors = convert(inp.content)
-			for coor in coors:
-				x, y = coor
-				if board_copy[x][y] == 'b':
-					if member:
-						scores[inp.author] += 1
-						if scores[inp.author] >= 30:
-							return await ctx.send(f'{inp.author.mention} won!!!')
-					else:
-						score += 1
-				else:
-					if member:
-						if scores[inp.author] > 0:
-							scores[inp.author] -= 1
-					else:
-						if score > 0:
-							score -= 1
+				first = await inputs.get(timeout=5)
+			except asyncio.TimeoutError:
+				replay.round([])
+				step_speed(state, None)
+			else:
+				if len(players) > 1:
+					await asyncio.sleep(renderer.interval) # the other players saw the same board, their answers of this round count too
+				messages = [first, *inputs.drain()]
+				if any(stops(inp) for inp in messages):
+					save_scores(ctx)
+					return await ctx.send("Stopped the game!")
+				if ctx.guild:
+					asyncio.get_event_loop().create_task(delete_answers(ctx.channel, messages))
+				with metrics.timer('tick_seconds', game='speed'):
+					answers = [(inp.author.id, list(convert(inp.content, size))) for inp in messages]
+					replay.round(answers)
+					step_speed(state, answers)
+				if state.winner:
+					save_scores(ctx)
+					return await ctx.send(f'<@{state.winner}> won!!!')
+			e = discord.Embed(title='Speed', description=scoreboard()+'\n'+format_speed_board(state.render(), state.blocks), color=discord.Color.blurple())
+			renderer.submit(msg, embed=e)
 
 @bot.command()
 @storyline_check()
 async def end(ctx):
-	del cache[str(ctx.author.id)] # The player will have to replay the game once again to be able to use the command again
-	num = await scene_5(ctx)
-	if num == 1:
-		await rapheal_betrayel_1(ctx)
-	if num == 2:
-		await rapheal_betrayel_2(ctx)
-	if num == 3:
-		await caroline_and_adam(ctx)
+	await bot.progress.reset(ctx.author.id) # The player will have to replay the game once again to be able to use the command again
+	await story.play(ctx, 'scene_5')
 
 @bot.command(aliases=['botinfo','about'])
 async def info(ctx):
@@ -1146,6 +462,55 @@ async def info(ctx):
 	embed = discord.Embed(title='Bot Info', description=f'I am a discord bot made by andreawthaderp#3031 for the documatic hackathon', color=discord.Color.dark_theme())
 	await ctx.send(embed=embed)
 
+@bot.command(name='sessions')
+@commands.is_owner()
+async def list_sessions(ctx):
+	"""The games that are running right now, how long they've been running and how much memory their state uses"""
+	if not sessions.sessions:
+		return await ctx.send("No games are running")
+	now = time.monotonic()
+	lines = []
+	for session in sessions.sessions.values():
+		game = session.ctx
+		lines.append(f"**{game.command.qualified_name}** by {game.author.mention} in {game.channel.mention if game.guild else 'DMs'} | age: {int(now-session.started)}s | idle: {int(now-session.last_input)}s | state: {deep_size(session.state)/1024:.1f} KiB")
+	embed = discord.Embed(title=f'{len(lines)} running games', description='\n'.join(lines)[:4096], color=discord.Color.dark_theme())
+	await ctx.send(embed=embed)
+
+@bot.command()
+@commands.is_owner()
+async def stats(ctx):
+	"""What the bot is doing: command and tick latencies, edits, requests and 429s, the database and the event loop lag"""
+	embed = discord.Embed(title='Stats', color=discord.Color.dark_theme())
+	lines = [f"**{command}**: {metrics.summary('command_first_frame_seconds', command=command)} to the first frame, {metrics.counters.get(('command_errors_total', (('command', command),)), 0)} errors" for command in metrics.labels('commands_total', 'command') if command in sessions.games]
+	embed.add_field(name='Commands', value='\n'.join(lines) or 'nothing yet', inline=False)
+	embed.add_field(name='Ticks', value='\n'.join(f"**{game}**: {metrics.summary('tick_seconds', game=game)}" for game in metrics.labels('tick_seconds', 'game')) or 'nothing yet', inline=False)
+	frames = ', '.join(f"{metrics.counters[key]} {dict(key[1])['via']}s" for key in metrics.counters if key[0] == 'frames_total')
+	embed.add_field(name='Frames', value=f"{frames or '0'} ({metrics.total('frame_errors_total')} failed)\nsubmitted -> shown: {metrics.summary('frame_delay_seconds')}", inline=False)
+	requests = sum(histogram.count for (name, _), histogram in metrics.histograms.items() if name == 'discord_request_seconds')
+	embed.add_field(name='Discord', value=f"{requests} requests, {metrics.total('discord_429_total')} 429s ({metrics.total('discord_429_retry_after_seconds_total'):.1f}s waited)", inline=False)
+	embed.add_field(name='Database', value=f"save_score: {metrics.summary('save_score_seconds')}\nscore flush: {metrics.summary('score_flush_seconds')}\nleaderboard: {metrics.summary('leaderboard_query_seconds')}", inline=False)
+	embed.add_field(name='Sessions', value=', '.join(f'{game}: {count}' for game, count in sessions.per_game().items()) or 'no games running', inline=False)
+	embed.add_field(name='Event loop lag', value=f"last: {metrics.lag*1000:.1f}ms, {metrics.summary('event_loop_lag_seconds')}", inline=False)
+	await ctx.send(embed=embed)
+
+async def resolve_users(user_ids, limit=5, known=None):
+	"""Turns user ids into users, uses the bot's cache and known (user id -> user) when it can and fetches the rest at the same time (at most limit requests at once)"""
+	semaphore = asyncio.Semaphore(limit)
+	known = known or {}
+	async def resolve(user_id):
+		user = bot.get_user(user_id) or known.get(user_id)
+		if user:
+			return user
+		async with semaphore:
+			try:
+				return await bot.fetch_user(user_id)
+			except discord.NotFound:
+				return None
+	return await asyncio.gather(*[resolve(user_id) for user_id in user_ids])
+
+leaderboard_embeds = {} # (command name, entries) -> (top version, embed), rebuilt only when the top scores change
+leaderboard_users = {} # command name -> {user id: user} of its last top, a rebuild only fetches the players that are new in it
+
 @bot.command(aliases=['lb'])
 @commands.guild_only()
 async def leaderboard(ctx, command_name, entries=5):
@@ -1153,44 +518,69 @@ async def leaderboard(ctx, command_name, entries=5):
 	cmd = bot.get_command(command_name)
 	if not cmd:
 		return await ctx.send(f'The command {command_name} does not exist')
-	embed = discord.Embed(title=f"Leaderboard", description=f"Top {entries} {command_name} scores\n\n", colour=0x24e0db)
-
-	index = 0
-	async with bot.db.execute("SELECT author_id, score FROM scores WHERE command_name = ? ORDER BY score DESC LIMIT ?", (cmd.name, entries)) as cursor:
-		async for entry in cursor:
-			member_id, score = entry
-			member = await bot.fetch_user(member_id)
-			index += 1
-			if index == 1:
-				emoji = '🥇'
-			elif index == 2:
-				emoji = "🥈"
-			elif index == 3:
-				emoji = "🥉"
-			else:
-				emoji = "🔹"
-			embed.description += f"**{emoji} #{index} {member.mention}**\nScore: `{score}`\n\n"
-	if not index:
-		return await ctx.send(f"No scores in the database for {command_name}")
+	name = score_name(cmd)
+	entries = max(1, min(entries, bot.scores.top_size))
+	with metrics.timer('leaderboard_query_seconds'):
+		top = (await bot.scores.leaderboard(name))[:entries]
+	if not top:
+		return await ctx.send(f"No scores in the database for {name}")
+	version = bot.scores.versions[name]
+	cached = leaderboard_embeds.get((name, entries))
+	if cached and cached[0] == version:
+		return await ctx.send(embed=cached[1])
+
+	embed = discord.Embed(title=f"Leaderboard", description=f"Top {entries} {name} scores\n\n", colour=0x24e0db)
+	users = await resolve_users([member_id for member_id, _ in top], known=leaderboard_users.get(name))
+	leaderboard_users.setdefault(name, {}).update((member_id, member) for (member_id, _), member in zip(top, users) if member)
+	if len(leaderboard_users[name]) > bot.scores.top_size*2: # players that dropped out of the top
+		ids = {member_id for member_id, _ in await bot.scores.leaderboard(name)}
+		leaderboard_users[name] = {member_id: member for member_id, member in leaderboard_users[name].items() if member_id in ids}
+	for index, ((member_id, score), member) in enumerate(zip(top, users), start=1):
+		if index == 1:
+			emoji = '🥇'
+		elif index == 2:
+			emoji = "🥈"
+		elif index == 3:
+			emoji = "🥉"
+		else:
+			emoji = "🔹"
+		embed.description += f"**{emoji} #{index} {member.mention if member else f'<@{member_id}>'}**\nScore: `{score}`\n\n"
+	leaderboard_embeds[(name, entries)] = (version, embed)
 
 	await ctx.send(embed=embed)
 
 # Event for catching errors 
 @bot.event
 async def on_command_error(ctx, error):
-	if isinstance(error, commands.CheckFailure):
+	if isinstance(error, SessionLimit):
+		return await ctx.send(str(error))
+	elif isinstance(error, commands.NotOwner):
+		return await ctx.send(f"The {ctx.command.name} command can only be used by the bot owner")
+	elif isinstance(error, commands.CheckFailure):
 		return await ctx.send('You need to play the "zombies" and "spaceshooter" and "maze" commands to be able to play the end command')
 	elif isinstance(error, commands.NoPrivateMessage):
 		return await ctx.send(f"The {ctx.command.name} command can only be used in a guild")
 	else:
 		raise error
 
-# run the score_db function
-bot.loop.create_task(score_db())
-bot.run(os.getenv("TOKEN"))
-asyncio.run(bot.db.close())
-# Close the db
+# run the score_db function, the session reaper and the metrics once the bot logged in
+@bot.event
+async def setup_hook():
+	bot.loop.create_task(score_db())
+	bot.loop.create_task(sessions.run())
+	metrics.instrument(bot)
+	bot.loop.create_task(metrics.watch_lag())
+	if os.getenv('METRICS_FILE'):
+		bot.loop.create_task(metrics.export(os.getenv('METRICS_FILE')))
+	if os.getenv('METRICS_PORT'):
+		await metrics.serve(int(os.getenv('METRICS_PORT')))
+
+async def main():
+	async with bot:
+		try:
+			await bot.start(os.getenv("TOKEN"))
+		finally:
+			await close_db() # Write the last scores and close the db
 
-with open("cache.json", "w") as f:
-    json.dump(cache, f, indent = 4)
-# Saving the cache so we won't loose the date when if the bot restarts
+if __name__ == '__main__': # bench.py imports this file for the board formatting
+	asyncio.run(main())
@@ -0,0 +1,156 @@
+"""Maze physics, every (cell, direction) move of a maze is worked out once when the maze is loaded so a move is a dict lookup"""
+import time
+from collections import deque
+UP = (-1, 0)
+DOWN = (1, 0)
+LEFT = (0, -1)
+RIGHT = (0, 1)
+
+arrows = {'u':UP, 'd':DOWN, 'l':LEFT, 'r':RIGHT}
+obstacles = {'w', 'b', *arrows} # the player never stands on these
+
+# move outcomes
+STOP = 'stop' # the player stopped in front of a wall or a breaking block
+DEAD = 'dead' # the player fell of the maze
+LOOP = 'loop' # the arrows keep the player moving forever
+
+
+class TooComplex(Exception):
+	"""Raised by solve when a maze has too many states to check within its budget"""
+
+class CompiledMaze:
+	"""Jump table of a maze board, maps (cell, direction) to (outcome, end cell, broken block)
+
+	The board is shared with the caller and changed in place when a breaking block breaks, only the moves that ended at that block are worked out again"""
+	def __init__(self, board):
+		self.board = board
+		self.table = {}
+		self.breakers = {} # breaking block -> the moves that break it
+		for x, row in enumerate(board):
+			for y, tile in enumerate(row):
+				if tile not in obstacles:
+					for direction in arrows.values():
+						self.resolve((x, y), direction)
+
+	def tile(self, cell):
+		x, y = cell
+		if x < 0 or y < 0 or x >= len(self.board) or y >= len(self.board[x]):
+			return None
+		return self.board[x][y]
+
+	def resolve(self, cell, direction):
+		"""Follows the move until it reaches a move that's already known, an end or a move it already went through (a loop)"""
+		chain = []
+		seen = set()
+		state = (cell, direction)
+		while state not in self.table:
+			if state in seen:
+				result = (LOOP, None, None)
+				break
+			seen.add(state)
+			chain.append(state)
+			(x, y), direction = state
+			ahead = (x+direction[0], y+direction[1])
+			tile = self.tile(ahead)
+			if tile is None:
+				result = (DEAD, None, None)
+				break
+			elif tile == 'w':
+				result = (STOP, (x, y), None)
+				break
+			elif tile == 'b':
+				result = (STOP, (x, y), ahead)
+				break
+			elif tile in arrows:
+				state = ((x, y), arrows[tile]) # arrows turn the player around without moving him
+			else:
+				state = (ahead, direction)
+		else:
+			result = self.table[state]
+		for state in chain:
+			self.table[state] = result
+		if result[2]:
+			self.breakers[result[2]] = self.breakers.get(result[2], []) + chain # a new list, the copies made by without share them
+		return result
+
+	def peek(self, cell, direction):
+		"""Returns (outcome, end cell, broken block) of a move without breaking anything"""
+		return self.table.get((cell, direction)) or self.resolve(cell, direction)
+
+	def move(self, cell, direction):
+		"""Returns (outcome, end cell) of moving from cell into direction, breaks the block the player stopped at"""
+		outcome, end, broken = self.peek(cell, direction)
+		if broken:
+			self.board[broken[0]][broken[1]] = 'g'
+			for state in self.breakers.pop(broken):
+				self.table.pop(state, None) # they get worked out again the next time they're used
+		return outcome, end
+
+	def without(self, block):
+		"""A copy of the maze with block broken, the moves that didn't end at it are kept instead of compiling the copy from scratch"""
+		maze = CompiledMaze.__new__(CompiledMaze)
+		maze.board = [list(row) for row in self.board]
+		maze.board[block[0]][block[1]] = 'g'
+		maze.table = dict(self.table)
+		maze.breakers = dict(self.breakers)
+		for state in maze.breakers.pop(block, ()):
+			maze.table.pop(state, None)
+		return maze
+
+
+def find(board, tile):
+	for x, row in enumerate(board):
+		for y, column in enumerate(row):
+			if column == tile:
+				return x, y
+
+def solve(board, limit=5000, timeout=0.5):
+	"""Breadth first search over the spots the player can reach, the broken blocks are part of the state since breaking one opens new paths
+
+	Returns (moves, deadly): moves is the shortest list of directions to the exit (None if there is no way to the exit)
+	and deadly is the share of the moves from the states searched until then that kill the player.
+	Raises TooComplex after limit states or timeout seconds, it's meant to answer in milliseconds"""
+	start = (find(board, 'p'), frozenset())
+	deadline = time.perf_counter() + timeout
+	parents = {start: None}
+	queue = deque([(start, CompiledMaze([list(row) for row in board]))]) # every state with the maze of its broken blocks
+	moves = deaths = 0
+	solution = None
+	while queue and solution is None:
+		if len(parents) > limit or time.perf_counter() > deadline:
+			raise TooComplex(f'Gave up after {len(parents)} states')
+		state, maze = queue.popleft()
+		cell, broken = state
+		for direction in arrows.values():
+			outcome, end, block = maze.peek(cell, direction)
+			moves += 1
+			if outcome != STOP:
+				deaths += 1
+				continue
+			after = (end, broken | {block} if block else broken)
+			if after in parents:
+				continue
+			parents[after] = (state, direction)
+			queue.append((after, maze.without(block) if block else maze))
+			if board[end[0]][end[1]] == 'x':
+				solution = after
+				break
+	if solution is None:
+		return None, deaths/max(moves, 1)
+	path = []
+	while parents[solution]:
+		solution, direction = parents[solution]
+		path.append(direction)
+	return path[::-1], deaths/max(moves, 1)
+
+def difficulty(moves, deadly):
+	"""Rates a solved maze from 1 (easy) to 5 (very hard) by the length of the shortest solution and how easy it is to die"""
+	score = len(moves) * (1 + deadly)
+	return 1 + sum(score > threshold for threshold in (3, 6, 10, 15))
+
+def rate(maze):
+	"""Returns (length of the shortest solution, difficulty) of a maze string, (None, 0) if the maze can't be beaten. Raises TooComplex like solve"""
+	moves, deadly = solve([list(line) for line in maze.split('\n')])
+	if moves is None:
+		return None, 0
+	return len(moves), difficulty(moves, deadly)
@@ -0,0 +1,203 @@
+"""Counters and latency histograms of what the bot is doing, shown by the owner only %stats command and exported in the Prometheus text format
+
+METRICS_FILE is a file the metrics are written to every few seconds (for node_exporter's textfile collector),
+METRICS_PORT a local port that serves them on GET /metrics. Both are off unless they're set"""
+import asyncio
+import logging
+import os
+import time
+
+buckets = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, float('inf')) # seconds
+
+
+def label_text(labels):
+	if not labels:
+		return ''
+	return '{' + ','.join(f'{key}="{value}"' for key, value in labels) + '}'
+
+class Histogram:
+	"""Observed durations counted into fixed buckets, so it takes the same memory after a million observations as after one"""
+	def __init__(self):
+		self.counts = [0]*len(buckets)
+		self.count = 0
+		self.sum = 0
+
+	def observe(self, seconds):
+		self.count += 1
+		self.sum += seconds
+		for index, bound in enumerate(buckets):
+			if seconds <= bound:
+				self.counts[index] += 1
+				break
+
+	def quantile(self, share):
+		"""The upper bound of the bucket the share-th observation fell into, None if nothing was observed"""
+		if not self.count:
+			return None
+		seen = 0
+		for bound, count in zip(buckets, self.counts):
+			seen += count
+			if seen >= share*self.count:
+				return bound
+
+class Timer:
+	"""with metrics.timer(name): ... observes how long the block took, also around awaits"""
+	def __init__(self, metrics, name, labels):
+		self.metrics = metrics
+		self.name = name
+		self.labels = labels
+
+	def __enter__(self):
+		self.start = time.perf_counter()
+		return self
+
+	def __exit__(self, *exc):
+		self.metrics.observe(self.name, time.perf_counter()-self.start, **self.labels)
+
+class RateLimitHandler(logging.Handler):
+	"""discord.py handles 429s itself and only logs them, this counts those log records"""
+	def __init__(self, metrics):
+		super().__init__(logging.WARNING)
+		self.metrics = metrics
+
+	def emit(self, record):
+		message = str(record.msg)
+		if 'responded with 429' in message and 'Retrying' in message:
+			method, _, retry_after = record.args
+			self.metrics.count('discord_429_total', method=method)
+			self.metrics.count('discord_429_retry_after_seconds_total', retry_after, method=method)
+		elif message.startswith('Global rate limit has been hit'):
+			self.metrics.count('discord_global_429_total')
+
+class Metrics:
+	"""The registry, names follow the Prometheus conventions: *_total for counters, *_seconds for histograms"""
+	def __init__(self):
+		self.counters = {} # (name, labels) -> value
+		self.histograms = {} # (name, labels) -> Histogram
+		self.gauges = {} # name -> function returning {labels: value}, called when the metrics are read
+		self.invoked = {} # command message id -> [when the command was invoked, whether it showed something yet]
+		self.lag = 0 # seconds the last event loop lag check was late
+
+	def key(self, name, labels):
+		return name, tuple(sorted(labels.items()))
+
+	def count(self, name, amount=1, **labels):
+		key = self.key(name, labels)
+		self.counters[key] = self.counters.get(key, 0) + amount
+
+	def observe(self, name, seconds, **labels):
+		key = self.key(name, labels)
+		if key not in self.histograms:
+			self.histograms[key] = Histogram()
+		self.histograms[key].observe(seconds)
+
+	def timer(self, name, **labels):
+		return Timer(self, name, labels)
+
+	def gauge(self, name, func):
+		"""func returns the value of the gauge, or {labels tuple: value} if it has labels"""
+		self.gauges[name] = func
+
+	def histogram(self, name, **labels):
+		return self.histograms.get(self.key(name, labels))
+
+	def total(self, name):
+		"""The sum of a counter over all its labels"""
+		return sum(value for (counter, _), value in self.counters.items() if counter == name)
+
+	def labels(self, name, label):
+		"""The values label has in the counters/histograms called name"""
+		return sorted({dict(labels)[label] for metric, labels in [*self.counters, *self.histograms] if metric == name and label in dict(labels)})
+
+	def summary(self, name, **labels):
+		"""One line about a histogram for the stats command, the quantiles are the upper bounds of their buckets"""
+		histogram = self.histogram(name, **labels)
+		if not histogram:
+			return 'nothing yet'
+		ms = lambda seconds: '>10s' if seconds == float('inf') else f'{seconds*1000:g}ms'
+		return f'{histogram.count}x, avg {histogram.sum/histogram.count*1000:.1f}ms, p50 ≤ {ms(histogram.quantile(0.5))}, p99 ≤ {ms(histogram.quantile(0.99))}'
+
+	# commands
+	def command_started(self, ctx):
+		self.invoked[ctx.message.id] = [time.perf_counter(), False]
+		self.count('commands_total', command=ctx.command.qualified_name)
+
+	def shown(self, ctx):
+		"""Called when a command put something on screen, only the first call of a command is observed"""
+		invoked = self.invoked.get(ctx.message.id)
+		if invoked and not invoked[1]:
+			invoked[1] = True
+			self.observe('command_first_frame_seconds', time.perf_counter()-invoked[0], command=ctx.command.qualified_name)
+
+	def command_finished(self, ctx, failed=False):
+		invoked = self.invoked.pop(ctx.message.id, None)
+		if invoked:
+			self.observe('command_seconds', time.perf_counter()-invoked[0], command=ctx.command.qualified_name)
+		if failed:
+			self.count('command_errors_total', command=ctx.command.qualified_name)
+
+	# discord
+	def instrument(self, bot):
+		"""Counts and times every REST request of the bot and the 429s discord.py retried"""
+		request = bot.http.request
+		async def timed_request(route, **kwargs):
+			with self.timer('discord_request_seconds', route=f'{route.method} {route.path}'):
+				return await request(route, **kwargs)
+		bot.http.request = timed_request
+		logging.getLogger('discord.http').addHandler(RateLimitHandler(self))
+
+	async def watch_lag(self, interval=0.5):
+		"""Measures how late a timer fires, that's how long the event loop was busy with other things. Runs until it's cancelled"""
+		loop = asyncio.get_event_loop()
+		while True:
+			start = loop.time()
+			await asyncio.sleep(interval)
+			self.lag = loop.time() - start - interval
+			self.observe('event_loop_lag_seconds', self.lag)
+
+	# export
+	def prometheus(self):
+		"""Every metric in the Prometheus text format"""
+		lines = []
+		for (name, labels), value in sorted(self.counters.items()):
+			lines.append(f'{name}{label_text(labels)} {value}')
+		for (name, labels), histogram in sorted(self.histograms.items()):
+			seen = 0
+			for bound, count in zip(buckets, histogram.counts):
+				seen += count
+				le = '+Inf' if bound == float('inf') else bound
+				lines.append(f'{name}_bucket{label_text(labels + (("le", le),))} {seen}')
+			lines.append(f'{name}_sum{label_text(labels)} {histogram.sum}')
+			lines.append(f'{name}_count{label_text(labels)} {histogram.count}')
+		for name, func in sorted(self.gauges.items()):
+			value = func()
+			for labels, number in (value.items() if isinstance(value, dict) else [((), value)]):
+				lines.append(f'{name}{label_text(labels)} {number}')
+		return '\n'.join(lines) + '\n'
+
+	async def export(self, path, interval=15):
+		"""Writes the metrics to path every interval seconds, replaces the file at once so nobody reads half of it"""
+		while True:
+			with open(path+'.tmp', 'w') as f:
+				f.write(self.prometheus())
+			os.replace(path+'.tmp', path)
+			await asyncio.sleep(interval)
+
+	async def serve(self, port, host='127.0.0.1'):
+		"""Serves the metrics on http://host:port/metrics"""
+		async def handle(reader, writer):
+			try:
+				request = await reader.readline()
+				while (await reader.readline()).strip(): # the headers
+					pass
+				if request.split(b' ')[1:2] == [b'/metrics']:
+					body = self.prometheus().encode()
+					writer.write(b'HTTP/1.1 200 OK\r\nContent-Type: text/plain; version=0.0.4\r\nContent-Length: %d\r\nConnection: close\r\n\r\n' % len(body) + body)
+				else:
+					writer.write(b'HTTP/1.1 404 Not Found\r\nContent-Length: 0\r\nConnection: close\r\n\r\n')
+				await writer.drain()
+			finally:
+				writer.close()
+		return await asyncio.start_server(handle, host, port)
+
+metrics = Metrics()
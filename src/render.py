@@ -0,0 +1,158 @@
+import asyncio
+import random
+import time
+from collections import OrderedDict
+import discord
+from metrics import metrics
+
+# board letter -> emoji, the earth is picked once per BoardRenderer
+glyphs = {'g':'⬛','G':'🟩','q':'🟦','p':'😳','L':'📍','z':'🧟','B':'💥', 's':'🚀', 'a':'👾', 'o':'💣', 'w':'🟥', 'x':'❌',' ':'⬛','u':'⏫','l':'⏪','r':'⏩','d':'⏬','b':'🔲'}
+earths = ['🌎','🌍','🌏']
+
+
+class BoardRenderer:
+	"""Turns boards (rows of letters) into emoji strings, every row is turned into emojis once and reused while it doesn't change"""
+	cache_size = 1024 # rows kept per renderer, a board only has a few different rows at a time
+
+	def __init__(self):
+		self.glyphs = {**glyphs, 'e': random.choice(earths)}
+		self.rows = {} # row letters -> emoji string
+		self.last = None # (row letters of the last frame, its emoji string)
+
+	def row(self, letters):
+		line = self.rows.get(letters)
+		if line is None:
+			if len(self.rows) >= self.cache_size:
+				self.rows.clear()
+			line = self.rows[letters] = ''.join([self.glyphs[letter] for letter in letters])
+		return line
+
+	def render(self, board):
+		keys = tuple(row if isinstance(row, str) else tuple(row) for row in board)
+		if self.last and self.last[0] == keys:
+			return self.last[1]
+		frame = '\n'.join([self.row(key) for key in keys])
+		self.last = (keys, frame)
+		return frame
+
+
+class RenderScheduler:
+	"""Coalesces message edits, every message has one pending frame slot and gets edited at most once per rate limit window"""
+	def __init__(self, interval=1.0):
+		self.interval = interval # discord allows 5 edits per 5 seconds per channel
+		self.pending = {} # message id -> (message, edit kwargs) of the newest frame that wasn't sent yet
+		self.tasks = {} # message id -> the task flushing that message
+		self.idle = {} # message id -> event that is set once every submitted frame was sent
+		self.sent = OrderedDict() # message id -> what the message shows, the newest messages only so it doesn't grow forever
+		self.remembered = 1000
+		self.interactions = {} # message id -> button press that wasn't answered yet, the next frame is sent as its response
+		self.answering = set() # presses whose response request is on its way, discord.py only marks them done once it returned
+		self.waiting = {} # message id -> when the oldest frame that wasn't sent yet was submitted
+
+	def frame(self, kwargs):
+		"""The edit kwargs as plain data so two frames can be compared"""
+		frame = {}
+		for key, value in kwargs.items():
+			if isinstance(value, discord.Embed):
+				value = value.to_dict()
+			elif isinstance(value, discord.ui.View):
+				value = (id(value), value.to_components())
+			frame[key] = value
+		return frame
+
+	def unchanged(self, msg_id, kwargs):
+		"""True if sending kwargs wouldn't change what the message shows"""
+		shown = self.sent.get(msg_id)
+		return shown is not None and {**shown, **self.frame(kwargs)} == shown
+
+	def submit(self, msg, **kwargs):
+		"""Queue a frame for msg without waiting for the edit, an older frame that wasn't sent yet is dropped"""
+		kwargs = {key: value.copy() if isinstance(value, discord.Embed) else value for key, value in kwargs.items()}
+		if msg.id in self.pending:
+			kwargs = {**self.pending[msg.id][1], **kwargs} # keep the content of the dropped frame if this one doesn't replace it
+		elif self.unchanged(msg.id, kwargs):
+			return # same as what's on screen, not worth an edit
+		self.pending[msg.id] = (msg, kwargs)
+		self.waiting.setdefault(msg.id, time.perf_counter())
+		if msg.id not in self.tasks:
+			self.idle[msg.id] = asyncio.Event()
+			self.tasks[msg.id] = asyncio.get_event_loop().create_task(self._flush_loop(msg.id))
+		else:
+			self.idle[msg.id].clear()
+
+	def answer(self, interaction, deadline=2):
+		"""Sends the next frame of the pressed message as the response of the press, interactions have to be answered within 3 seconds
+		so if no frame came in deadline seconds the press is acknowledged without one. The deadline is below the game ticks (2.5-3.5s)
+		so it doesn't fire together with the frame of a tick, and leaves a second for the defer request"""
+		self.interactions[interaction.message.id] = interaction
+		asyncio.get_event_loop().create_task(self._expire(interaction, deadline))
+
+	async def _expire(self, interaction, deadline):
+		await asyncio.sleep(deadline)
+		if self.interactions.get(interaction.message.id) is interaction:
+			del self.interactions[interaction.message.id]
+		if interaction not in self.answering and not interaction.response.is_done():
+			try:
+				await interaction.response.defer()
+			except discord.HTTPException:
+				pass
+
+	async def flush(self, msg):
+		"""Wait until every frame submitted for msg has been sent"""
+		event = self.idle.get(msg.id)
+		if event:
+			await event.wait()
+
+	def discard(self, msg):
+		"""Drop the pending frame of msg, used when the message is about to be deleted"""
+		self.pending.pop(msg.id, None)
+		self.waiting.pop(msg.id, None)
+		self.sent.pop(msg.id, None)
+
+	async def _flush_loop(self, msg_id):
+		last_flush = 0
+		try:
+			while True:
+				wait = last_flush + self.interval - time.monotonic()
+				if wait > 0:
+					await asyncio.sleep(wait) # frames submitted while sleeping replace the pending one
+				if msg_id not in self.pending:
+					break # nothing was submitted during the whole window, the next frame can be sent right away
+				msg, kwargs = self.pending.pop(msg_id)
+				waiting = self.waiting.pop(msg_id, None)
+				if self.unchanged(msg_id, kwargs):
+					self.idle[msg_id].set()
+					continue # the frames since the last edit ended up where they started
+				last_flush = time.monotonic()
+				interaction = self.interactions.pop(msg_id, None)
+				try:
+					if interaction and not interaction.response.is_done():
+						via = 'interaction'
+						self.answering.add(interaction) # taken before the await, _expire must not defer it while the edit is on its way
+						try:
+							await interaction.response.edit_message(**kwargs) # one request for the press and the frame
+						finally:
+							self.answering.discard(interaction)
+					else:
+						via = 'edit'
+						await msg.edit(**kwargs)
+				except discord.NotFound:
+					self.pending.pop(msg_id, None)
+					self.sent.pop(msg_id, None)
+					self.waiting.pop(msg_id, None)
+					break
+				except discord.HTTPException:
+					metrics.count('frame_errors_total')
+				else:
+					metrics.count('frames_total', via=via)
+					if waiting is not None:
+						metrics.observe('frame_delay_seconds', time.perf_counter()-waiting) # submitted -> on screen, the rate limit window plus the request
+					self.sent[msg_id] = {**self.sent.get(msg_id, {}), **self.frame(kwargs)}
+					self.sent.move_to_end(msg_id)
+					if len(self.sent) > self.remembered:
+						self.sent.popitem(last=False)
+				if msg_id not in self.pending:
+					self.idle[msg_id].set()
+		finally:
+			del self.tasks[msg_id]
+			self.idle.pop(msg_id).set()
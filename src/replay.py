@@ -0,0 +1,182 @@
+"""Replay logs, the seed of a game and its inputs: enough to play the exact same game again
+
+Every zombies/spaceshooter/speed session draws from its own random.Random(seed), so the seed and the inputs decide everything.
+A log is a 16 byte header (game, seed, speed board size/goal, number of players) and one record per input:
+
+	ticks since the last record (varint) | code (1 byte) | payload
+
+The ticks are the time of the input, in game time (speed: rounds), so a replay plays as fast as the CPU can go.
+zombies/spaceshooter: the code is the index of the direction in engine.directions, no payload
+speed: the code is the player (0 is the one who started the game), the payload is the number of cells (varint) and one byte per cell
+       players from 254 on have the code 254 and their number as a varint before the payload
+end: code 255, the payload is the final score of every player (varints)
+
+A move is 2 bytes, a speed answer 3 bytes plus one per coordinate.
+
+	python replay.py                   verifies the replays of the best scores in scores.db
+	python replay.py zombies -n 5      only the 5 best zombies replays
+"""
+import argparse
+import asyncio
+import os
+import struct
+import sys
+import time
+import storage
+from engine import directions, ZombiesState, SpaceshooterState, SpeedState, tick, step_speed
+
+here = os.path.dirname(os.path.abspath(__file__))
+headers = {1: struct.Struct('<2sBBQBBB'), 2: struct.Struct('<2sBBQBBH')} # magic, version, game, seed, speed board size, speed goal (0 is none), players
+magic = b'RP'
+version = 2 # 1 had a byte for the number of players, lobbies can have more than 255
+header = headers[version]
+many = 254 # speed: the player's number didn't fit in the code, it follows as a varint
+end = 255
+games = {ZombiesState: 0, SpaceshooterState: 1, SpeedState: 2}
+state_types = {code: state_type for state_type, code in games.items()}
+
+
+def varint(number):
+	"""7 bits per byte (LEB128), numbers below 128 are a single byte"""
+	data = bytearray()
+	while number >= 0x80:
+		data.append(number & 0x7f | 0x80)
+		number >>= 7
+	data.append(number)
+	return data
+
+def read_varint(data, offset):
+	"""Returns (number, offset after it)"""
+	number = shift = 0
+	while True:
+		byte = data[offset]
+		offset += 1
+		number |= (byte & 0x7f) << shift
+		if byte < 0x80:
+			return number, offset
+		shift += 7
+
+def scores(state):
+	"""The score of every player, in the order of the players"""
+	if hasattr(state, 'scores'):
+		return list(state.scores.values())
+	return [state.score]
+
+
+class Recorder:
+	"""The log of one game while it's played, the game calls tick/round right before it steps the state"""
+	def __init__(self, state, seed):
+		self.state = state
+		speed = isinstance(state, SpeedState)
+		self.players = {player: index for index, player in enumerate(state.scores)} if speed else {}
+		self.log = bytearray(header.pack(magic, version, games[type(state)], seed, state.size if speed else 0, (state.goal or 0) if speed else 0, max(len(self.players), 1)))
+		self.ticks = 0 # ticks since the last record
+
+	def record(self, code, payload=b''):
+		self.log += varint(self.ticks)
+		self.log.append(code)
+		self.log += payload
+		self.ticks = 0
+
+	def tick(self, inputs):
+		"""The directions engine.tick is about to apply"""
+		for direction in inputs:
+			self.record(directions.index(direction))
+		self.ticks += 1
+
+	def round(self, answers):
+		"""The answers step_speed is about to score, (player, cells) in the order they're scored"""
+		size = self.state.size
+		for player, cells in answers:
+			if cells:
+				index = self.players[player]
+				payload = varint(len(cells)) + bytes(x*size + y for x, y in cells)
+				self.record(index, payload) if index < many else self.record(many, varint(index) + payload)
+		self.ticks += 1
+
+	def finish(self):
+		"""The log so far plus the end record with the scores, the game can go on recording after it"""
+		return bytes(self.log + varint(self.ticks) + bytes([end]) + b''.join(varint(score) for score in scores(self.state)))
+
+
+def replay(data):
+	"""Plays a log again, returns (the state at the end, the scores the log claims, the number of ticks)"""
+	if data[:2] != magic or data[2] not in headers:
+		raise ValueError('Not a replay log')
+	log_header = headers[data[2]]
+	_, _, game, seed, size, goal, players = log_header.unpack_from(data)
+	if game not in state_types:
+		raise ValueError(f"Game {game} isn't a game that can be replayed")
+	state_type = state_types[game]
+	if state_type is SpeedState:
+		state = SpeedState(list(range(players)), goal=goal or None, size=size, seed=seed)
+		advance = step_speed
+	else:
+		state = state_type(seed=seed)
+		advance = tick
+	offset = log_header.size
+	inputs = [] # the inputs of the tick that's being read
+	ticks = 0
+	while True:
+		delta, offset = read_varint(data, offset)
+		if delta:
+			advance(state, inputs)
+			for _ in range(delta-1):
+				advance(state, [])
+			inputs = []
+			ticks += delta
+		code = data[offset]
+		offset += 1
+		if code == end:
+			break
+		if state_type is SpeedState:
+			if code == many:
+				code, offset = read_varint(data, offset)
+			count, offset = read_varint(data, offset)
+			inputs.append((code, [divmod(cell, size) for cell in data[offset:offset+count]]))
+			offset += count
+		else:
+			inputs.append(directions[code])
+	claimed = []
+	while offset < len(data):
+		score, offset = read_varint(data, offset)
+		claimed.append(score)
+	return state, claimed, ticks
+
+def verify(data):
+	"""Returns (whether the log plays out to the scores it claims, the claimed scores, the replayed scores, the number of ticks)"""
+	state, claimed, ticks = replay(data)
+	replayed = scores(state)
+	return claimed == replayed, claimed, replayed, ticks
+
+
+async def verify_db(path, command_name=None, limit=25):
+	"""Verifies the replays of the best scores, returns the number of replays that don't add up"""
+	db = await storage.aiosqlite.connect(path)
+	try:
+		rows = await storage.ReplayStore(db).best(command_name, limit)
+	finally:
+		await db.close()
+	failed = 0
+	total_ticks = 0
+	start = time.perf_counter()
+	for author_id, game, score, log in rows:
+		ok, claimed, replayed, ticks = verify(log)
+		ok = ok and claimed[0] == score
+		total_ticks += ticks
+		failed += not ok
+		print(f"{game:<14}{author_id:<22}{score:>6}  {len(log):>6} B  {ticks:>6} ticks  " + ('ok' if ok else f'MISMATCH: saved {score}, log claims {claimed}, replay got {replayed}'))
+	elapsed = time.perf_counter() - start
+	print(f"{len(rows)} replays, {failed} mismatches, {total_ticks/max(elapsed, 1e-9):,.0f} ticks/sec")
+	return failed
+
+def main_cli():
+	parser = argparse.ArgumentParser(description='Verifies the replay logs of the best scores by playing them again')
+	parser.add_argument('game', nargs='?', help='only the replays of this command')
+	parser.add_argument('-n', '--limit', type=int, default=25, help='how many of the best replays of every game')
+	parser.add_argument('--db', default=os.path.join(here, 'scores.db'))
+	args = parser.parse_args()
+	sys.exit(1 if asyncio.run(verify_db(args.db, args.game, args.limit)) else 0)
+
+if __name__ == '__main__':
+	main_cli()
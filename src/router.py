@@ -0,0 +1,95 @@
+"""Routes reactions and messages to the game waiting for them
+
+bot.wait_for tests every event against the check of every waiting game, the router looks the game up in a dict instead:
+reactions by (message id, user id) and messages by (channel id, author id), so an event reaches its game in O(1)"""
+import asyncio
+
+
+class Inbox:
+	"""The inputs of one game, a queue the router fills. Use it as a context manager so it stops listening when the game ends"""
+	def __init__(self, table, keys, check=None, users=()):
+		self.table = table
+		self.keys = []
+		self.users = users # the users of a reaction inbox, follow listens to their reactions on the new message
+		self.check = check # inputs it returns False for are ignored, like a wait_for check
+		self.queue = asyncio.Queue()
+		self.listen(keys)
+
+	def listen(self, keys):
+		self.close()
+		self.keys = list(keys)
+		for key in self.keys:
+			self.table.setdefault(key, []).append(self)
+
+	def follow(self, msg):
+		"""Listens to the reactions of another message, for games that move to a new message"""
+		self.listen([(msg.id, user.id) for user in self.users])
+
+	def close(self):
+		for key in self.keys:
+			inboxes = self.table.get(key, [])
+			if self in inboxes:
+				inboxes.remove(self)
+			if not inboxes:
+				self.table.pop(key, None)
+		self.keys = []
+
+	def put(self, item):
+		if self.check and not self.check(item):
+			return False
+		self.queue.put_nowait(item)
+		return True
+
+	def drain(self):
+		"""Returns every input that came in so far, oldest first, without waiting"""
+		items = []
+		while not self.queue.empty():
+			items.append(self.queue.get_nowait())
+		return items
+
+	async def get(self, timeout=None):
+		"""Returns the next input, raises asyncio.TimeoutError if nothing came in timeout seconds"""
+		return await asyncio.wait_for(self.queue.get(), timeout)
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *exc):
+		self.close()
+
+class InputRouter:
+	"""One reaction listener and one message listener for every game, the newest inbox of a key gets the input first"""
+	def __init__(self, bot, on_input=None):
+		self.on_input = on_input # called with the user id of every input that reached a game
+		self.reaction_inboxes = {} # (message id, user id) -> [inbox, ...]
+		self.message_inboxes = {} # (channel id, author id) -> [inbox, ...]
+		bot.add_listener(self.on_reaction_add)
+		bot.add_listener(self.on_message)
+
+	def reactions(self, msg, *users, emojis=None):
+		"""Inbox of the reactions users add to msg, the inputs are the emojis as strings. msg can be None if the game didn't send it yet"""
+		keys = [(msg.id, user.id) for user in users] if msg else []
+		return Inbox(self.reaction_inboxes, keys, check=(lambda emoji: emoji in emojis) if emojis else None, users=users)
+
+	def messages(self, channel, *authors, check=None):
+		"""Inbox of the messages authors send in channel"""
+		return Inbox(self.message_inboxes, [(channel.id, author.id) for author in authors], check=check)
+
+	def route(self, table, key, item):
+		"""Gives item to the newest inbox of key that accepts it, returns False if none did"""
+		for inbox in reversed(table.get(key, ())):
+			if inbox.put(item):
+				if self.on_input:
+					self.on_input(key[1])
+				return True
+		return False
+
+	def press(self, message_id, user_id, key):
+		"""A button press, it goes to the same inboxes as a reaction on that message would"""
+		return self.route(self.reaction_inboxes, (message_id, user_id), key)
+
+	async def on_reaction_add(self, reaction, user):
+		self.route(self.reaction_inboxes, (reaction.message.id, user.id), str(reaction.emoji))
+
+	async def on_message(self, message):
+		self.route(self.message_inboxes, (message.channel.id, message.author.id), message)
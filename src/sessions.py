@@ -0,0 +1,140 @@
+"""Every running game is a session, the manager caps how many can run at once and cancels the ones nobody plays anymore"""
+import asyncio
+import secrets
+import sys
+import time
+from discord.ext import commands
+
+
+class SessionLimit(commands.CommandError):
+	"""Raised before a game starts if the player, the channel or the guild already has too many games running"""
+	def __init__(self, scope, limit):
+		self.scope = scope
+		self.limit = limit
+		super().__init__(f"This {scope} already has {limit} game{'s' if limit != 1 else ''} running, finish one first")
+
+def deep_size(obj, seen=None):
+	"""Rough memory use of obj and everything it references, in bytes"""
+	if seen is None:
+		seen = set()
+	if id(obj) in seen:
+		return 0
+	seen.add(id(obj))
+	size = sys.getsizeof(obj)
+	if isinstance(obj, dict):
+		size += sum(deep_size(key, seen) + deep_size(value, seen) for key, value in obj.items())
+	elif isinstance(obj, (list, tuple, set, frozenset)):
+		size += sum(deep_size(item, seen) for item in obj)
+	elif hasattr(obj, '__dict__'):
+		size += deep_size(vars(obj), seen)
+	return size
+
+
+class Session:
+	"""One running game, state is the game state once the game attached it"""
+	def __init__(self, ctx, task):
+		self.ctx = ctx
+		self.task = task
+		self.state = None
+		self.players = {ctx.author.id}
+		self.started = self.last_input = time.monotonic()
+		self.reaped = False # True if the manager cancelled it for being idle
+		self.seed = secrets.randbits(64) # every random thing in the game comes from this, the replay log saves it
+		self.replay = None # the game's replay.Recorder, for the games that have one
+
+	def touch(self):
+		self.last_input = time.monotonic()
+
+	def score(self):
+		"""The score of the player who started the game, None for games without a score"""
+		if hasattr(self.state, 'scores'):
+			return self.state.scores.get(self.ctx.author.id)
+		return getattr(self.state, 'score', None)
+
+class SessionManager:
+	"""Registry of the running games, opened before a game command runs and closed after it returns or gets cancelled"""
+	games = {'zombies', 'spaceshooter', 'maze', 'speed', 'speed lobby', 'end'} # the commands that run as a session
+
+	def __init__(self, per_user=2, per_channel=5, per_guild=25, idle_timeout=300):
+		self.limits = {'user': per_user, 'channel': per_channel, 'guild': per_guild}
+		self.idle_timeout = idle_timeout
+		self.sessions = {} # command message id -> session
+		self.counts = {} # (scope, id) -> number of running sessions
+		self.by_player = {} # user id -> sessions the user plays in, so an input finds its sessions without a scan
+
+	def scopes(self, ctx):
+		yield 'user', ctx.author.id
+		yield 'channel', ctx.channel.id
+		if ctx.guild:
+			yield 'guild', ctx.guild.id
+
+	def open(self, ctx):
+		"""Registers the game ctx is about to run, raises SessionLimit if a cap is reached"""
+		for scope in self.scopes(ctx):
+			if self.counts.get(scope, 0) >= self.limits[scope[0]]:
+				raise SessionLimit(scope[0], self.limits[scope[0]])
+		for scope in self.scopes(ctx):
+			self.counts[scope] = self.counts.get(scope, 0) + 1
+		session = Session(ctx, asyncio.current_task())
+		self.sessions[ctx.message.id] = session
+		self.by_player.setdefault(ctx.author.id, set()).add(session)
+		return session
+
+	def seed(self, ctx):
+		"""The seed of the game of ctx, a random one if ctx isn't a session"""
+		session = self.sessions.get(ctx.message.id)
+		return session.seed if session else secrets.randbits(64)
+
+	def attach(self, ctx, state, players=(), replay=None):
+		"""Tells the manager what the game of ctx is, its state is what gets measured and scored, players are the other users in the game"""
+		session = self.sessions.get(ctx.message.id)
+		if session is None:
+			return
+		session.state = state
+		session.replay = replay
+		for player in players:
+			session.players.add(player.id)
+			self.by_player.setdefault(player.id, set()).add(session)
+
+	def per_game(self):
+		"""command name -> number of running sessions"""
+		games = {}
+		for session in self.sessions.values():
+			games[session.ctx.command.qualified_name] = games.get(session.ctx.command.qualified_name, 0) + 1
+		return games
+
+	def touch(self, user_id):
+		"""Called for every input, the sessions the user plays in aren't idle"""
+		for session in self.by_player.get(user_id, ()):
+			session.touch()
+
+	def close(self, ctx):
+		"""Removes the session of ctx and returns it, None if ctx wasn't a session"""
+		session = self.sessions.pop(ctx.message.id, None)
+		if session is None:
+			return None
+		for scope in self.scopes(ctx):
+			self.counts[scope] -= 1
+			if not self.counts[scope]:
+				del self.counts[scope]
+		for player in session.players:
+			sessions = self.by_player.get(player)
+			if sessions:
+				sessions.discard(session)
+				if not sessions:
+					del self.by_player[player]
+		return session
+
+	def reap(self):
+		"""Cancels every session that got no input for idle_timeout seconds, the command's after invoke hook closes them"""
+		now = time.monotonic()
+		for session in list(self.sessions.values()):
+			if not session.reaped and now - session.last_input > self.idle_timeout:
+				session.reaped = True
+				session.task.cancel()
+
+	async def run(self):
+		"""Reaps the idle sessions a few times per timeout, runs until it's cancelled"""
+		while True:
+			await asyncio.sleep(max(self.idle_timeout/4, 1))
+			self.reap()
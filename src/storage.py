@@ -0,0 +1,310 @@
+"""Everything the bot saves, all of it lives in scores.db and goes through the bot's aiosqlite connection
+
+Every worker process of the launcher has its own connection to the same file, SQLite's WAL mode lets them read while one writes.
+The in memory caches are dropped once another process committed something (PRAGMA data_version changed)"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import random
+import aiosqlite
+from mazes import rate, TooComplex
+from metrics import metrics
+
+log = logging.getLogger(__name__)
+
+async def data_version(db):
+	"""A number that changes every time another connection commits, the commits of this connection don't change it"""
+	cursor = await db.execute("PRAGMA data_version")
+	return (await cursor.fetchone())[0]
+
+async def rate_in_thread(maze):
+	"""mazes.rate in a worker thread so the event loop isn't blocked, a maze too complex to solve is saved like one that can't be beaten"""
+	try:
+		return await asyncio.to_thread(rate, maze)
+	except TooComplex:
+		return None, 0
+
+async def connect(path='scores.db'):
+	"""Opens the database and sets up every store, returns (db, scores, progress, mazes, replays)"""
+	db = await aiosqlite.connect(path, timeout=30) # wait for the write lock of the other processes instead of failing
+	scores = ScoreStore(db)
+	await scores.setup()
+	progress = ProgressStore(db)
+	await progress.setup()
+	mazes = MazeStore(db)
+	await mazes.setup()
+	replays = ReplayStore(db)
+	await replays.setup()
+	return db, scores, progress, mazes, replays
+
+
+
+class ScoreStore:
+	"""The best score of every player in every game, scores are kept in memory and written in one transaction every few seconds"""
+	top_size = 25 # the most entries a leaderboard can show
+
+	def __init__(self, db, interval=5):
+		self.db = db
+		self.interval = interval
+		self.buffer = {} # (author id, command name) -> best score that wasn't written yet
+		self.top = {} # command name -> [(author id, score), ...] best scores first, loaded the first time the leaderboard is asked for
+		self.versions = {} # command name -> number that goes up every time the top changes
+		self.data_version = None
+		self.fresh = set() # the command names whose top was read after the last write of another process
+
+	async def setup(self):
+		"""Creates the scores table, the old table had no unique key so the duplicate rows are removed first"""
+		await self.db.execute("PRAGMA journal_mode=WAL")
+		await self.db.execute("PRAGMA synchronous=NORMAL") # WAL is still crash safe with this, it just doesn't fsync every commit
+		await self.db.execute("CREATE TABLE IF NOT EXISTS scores (author_id int, score int, command_name text)")
+		await self.db.execute("DELETE FROM scores WHERE rowid NOT IN (SELECT rowid FROM (SELECT rowid, max(score) FROM scores GROUP BY author_id, command_name))")
+		await self.db.execute("CREATE UNIQUE INDEX IF NOT EXISTS scores_player ON scores (author_id, command_name)")
+		await self.db.execute("CREATE INDEX IF NOT EXISTS scores_leaderboard ON scores (command_name, score DESC)")
+		await self.db.commit()
+
+	def save(self, author_id, command_name, score):
+		"""Queues a score, only the best score of a player is kept"""
+		key = (author_id, command_name)
+		if score > self.buffer.get(key, score-1):
+			self.buffer[key] = score
+		self.update_top(command_name, author_id, score)
+
+	def update_top(self, command_name, author_id, score):
+		top = self.top.get(command_name)
+		if top is None:
+			return
+		old = dict(top).get(author_id)
+		if old is not None and old >= score:
+			return
+		if old is None and len(top) == self.top_size and score <= top[-1][1]:
+			return
+		top[:] = sorted([entry for entry in top if entry[0] != author_id] + [(author_id, score)], key=lambda entry: entry[1], reverse=True)[:self.top_size]
+		self.versions[command_name] = self.versions.get(command_name, 0) + 1
+
+	async def leaderboard(self, command_name):
+		"""Returns the top scores of a game, only the first call for a game reads the database, the rest is kept up to date by save
+
+		If another process wrote to the database since then, the top scores are read again. data_version changes with any write, so the version only goes up if the top is different"""
+		version = await data_version(self.db)
+		if version != self.data_version:
+			self.data_version = version
+			self.fresh.clear()
+		if command_name not in self.fresh:
+			await self.flush()
+			cursor = await self.db.execute("SELECT author_id, score FROM scores WHERE command_name = ? ORDER BY score DESC LIMIT ?", (command_name, self.top_size))
+			top = list(await cursor.fetchall())
+			if top != self.top.get(command_name):
+				self.top[command_name] = top
+				self.versions[command_name] = self.versions.get(command_name, 0) + 1
+			self.fresh.add(command_name)
+		return self.top[command_name]
+
+	async def flush(self):
+		"""Writes every queued score in a single transaction, if that fails the scores are queued again and the error is raised"""
+		if not self.buffer:
+			return
+		buffer, self.buffer = self.buffer, {}
+		try:
+			with metrics.timer('score_flush_seconds'):
+				await self.db.executemany("INSERT INTO scores (author_id, score, command_name) VALUES (?,?,?) ON CONFLICT (author_id, command_name) DO UPDATE SET score = excluded.score WHERE excluded.score > score", [(author_id, score, command_name) for (author_id, command_name), score in buffer.items()])
+				await self.db.commit()
+		except Exception:
+			metrics.count('score_flush_errors_total')
+			for key, score in buffer.items(): # the scores saved while it was writing might be better
+				if score > self.buffer.get(key, score-1):
+					self.buffer[key] = score
+			raise
+
+	async def run(self):
+		"""Flushes the queued scores every interval seconds, runs until it's cancelled. A failed flush (the database locked by another worker, a full disk) is retried with the next one"""
+		while True:
+			await asyncio.sleep(self.interval)
+			try:
+				await self.flush()
+			except Exception:
+				log.exception("Couldn't write the scores, trying again in %s seconds", self.interval)
+
+class ReplayStore:
+	"""The replay log (see replay.py) of the best score of every player in every game, queued and written in batches like the scores"""
+	def __init__(self, db, interval=5):
+		self.db = db
+		self.interval = interval
+		self.buffer = {} # (author id, command name) -> (score, log) of the best game that wasn't written yet
+
+	async def setup(self):
+		await self.db.execute("CREATE TABLE IF NOT EXISTS replays (author_id int, command_name text, score int, log blob)")
+		await self.db.execute("CREATE UNIQUE INDEX IF NOT EXISTS replays_player ON replays (author_id, command_name)")
+		await self.db.commit()
+
+	def save(self, author_id, command_name, score, log):
+		"""Queues a log, only the log of the best score of a player is kept"""
+		key = (author_id, command_name)
+		if key not in self.buffer or score > self.buffer[key][0]:
+			self.buffer[key] = (score, log)
+
+	async def best(self, command_name=None, limit=25):
+		"""[(author id, command name, score, log), ...] of the limit best scores of a game, or of every game if command_name is None"""
+		await self.flush()
+		where, args = ("WHERE command_name = ?", (command_name,)) if command_name else ("", ())
+		cursor = await self.db.execute(f"SELECT author_id, command_name, score, log FROM (SELECT *, row_number() OVER (PARTITION BY command_name ORDER BY score DESC) AS place FROM replays {where}) WHERE place <= ? ORDER BY command_name, score DESC", (*args, limit))
+		return list(await cursor.fetchall())
+
+	async def flush(self):
+		"""Writes every queued log in a single transaction, if that fails the logs are queued again and the error is raised"""
+		if not self.buffer:
+			return
+		buffer, self.buffer = self.buffer, {}
+		try:
+			await self.db.executemany("INSERT INTO replays (author_id, command_name, score, log) VALUES (?,?,?,?) ON CONFLICT (author_id, command_name) DO UPDATE SET score = excluded.score, log = excluded.log WHERE excluded.score > score", [(author_id, command_name, score, log) for (author_id, command_name), (score, log) in buffer.items()])
+			await self.db.commit()
+		except Exception:
+			metrics.count('replay_flush_errors_total')
+			for (author_id, command_name), (score, data) in buffer.items():
+				self.save(author_id, command_name, score, data) # only replaces the logs saved since if they're better
+			raise
+
+	async def run(self):
+		"""Flushes the queued logs every interval seconds, runs until it's cancelled. A failed flush is retried with the next one"""
+		while True:
+			await asyncio.sleep(self.interval)
+			try:
+				await self.flush()
+			except Exception:
+				log.exception("Couldn't write the replays, trying again in %s seconds", self.interval)
+
+class ProgressStore:
+	"""Which storyline chapters every player finished, one bit per chapter so a player is a single row that's updated in place"""
+	chapters = {'zombies':1, 'spaceshooter':2, 'maze':4}
+	everything = 7
+
+	def __init__(self, db, interval=300):
+		self.db = db
+		self.interval = interval
+		self.progress = {} # author id -> chapters bitmask, only the players that were looked up since the bot started
+		self.data_version = None
+
+	async def setup(self, legacy_file='cache.json'):
+		"""Creates the progress table and moves the progress of the old cache.json file into it"""
+		await self.db.execute("CREATE TABLE IF NOT EXISTS progress (author_id INTEGER PRIMARY KEY, chapters int)")
+		if os.path.exists(legacy_file):
+			with open(legacy_file, 'r') as f:
+				cache = json.load(f)
+			for author_id, commands in cache.items():
+				await self.complete(int(author_id), *commands, commit=False)
+			os.replace(legacy_file, legacy_file+'.migrated')
+		await self.db.commit()
+
+	async def get(self, author_id):
+		version = await data_version(self.db)
+		if version != self.data_version:
+			self.data_version = version
+			self.progress.clear() # another process might have changed it, a player can play in guilds of different shards
+		if author_id not in self.progress:
+			cursor = await self.db.execute("SELECT chapters FROM progress WHERE author_id = ?", (author_id,))
+			row = await cursor.fetchone()
+			self.progress[author_id] = row[0] if row else 0
+		return self.progress[author_id]
+
+	async def complete(self, author_id, *command_names, commit=True):
+		"""Marks chapters as finished, only writes if one of them wasn't finished yet"""
+		bits = 0
+		for command_name in command_names:
+			bits |= self.chapters.get(command_name, 0)
+		old = await self.get(author_id)
+		if old | bits == old:
+			return
+		self.progress[author_id] = old | bits
+		await self.db.execute("INSERT INTO progress (author_id, chapters) VALUES (?,?) ON CONFLICT (author_id) DO UPDATE SET chapters = chapters | excluded.chapters", (author_id, bits))
+		if commit:
+			await self.db.commit()
+
+	async def played(self, author_id, command_name):
+		return bool(await self.get(author_id) & self.chapters.get(command_name, 0))
+
+	async def finished(self, author_id):
+		return await self.get(author_id) & self.everything == self.everything
+
+	async def reset(self, author_id):
+		self.progress[author_id] = 0
+		await self.db.execute("DELETE FROM progress WHERE author_id = ?", (author_id,))
+		await self.db.commit()
+
+	async def run(self):
+		"""Checkpoints the WAL into scores.db every interval seconds so it doesn't keep growing, runs until it's cancelled. A failed checkpoint is tried again with the next one"""
+		while True:
+			await asyncio.sleep(self.interval)
+			try:
+				await self.db.execute("PRAGMA wal_checkpoint(PASSIVE)")
+			except Exception:
+				log.exception("Couldn't checkpoint the WAL, trying again in %s seconds", self.interval)
+
+class MazeStore:
+	"""The user made mazes, one row per maze with a hash of the maze so the same maze can't be saved twice
+
+	Every maze is solved when it's added, the length of the shortest solution and the difficulty (1-5, 0 if it can't be beaten) are saved with it.
+	The position of a maze is the number of mazes of its difficulty added before it, so a random maze of a difficulty is one index lookup"""
+	def __init__(self, db):
+		self.db = db
+
+	async def setup(self, legacy_file='levels.txt'):
+		"""Creates the mazes table and moves the mazes of the old levels.txt file into it"""
+		await self.db.execute("CREATE TABLE IF NOT EXISTS mazes (id INTEGER PRIMARY KEY, hash TEXT UNIQUE, maze TEXT, min_moves int, difficulty int)")
+		cursor = await self.db.execute("PRAGMA table_info(mazes)")
+		columns = [column[1] for column in await cursor.fetchall()]
+		if 'difficulty' not in columns:
+			await self.db.execute("ALTER TABLE mazes ADD COLUMN min_moves int")
+			await self.db.execute("ALTER TABLE mazes ADD COLUMN difficulty int")
+		if 'position' not in columns:
+			await self.db.execute("ALTER TABLE mazes ADD COLUMN position int")
+		await self.db.execute("DROP INDEX IF EXISTS mazes_difficulty")
+		await self.db.execute("CREATE UNIQUE INDEX IF NOT EXISTS mazes_position ON mazes (difficulty, position)")
+		cursor = await self.db.execute("SELECT id, maze FROM mazes WHERE difficulty IS NULL")
+		for maze_id, maze in await cursor.fetchall():
+			await self.db.execute("UPDATE mazes SET min_moves = ?, difficulty = ? WHERE id = ?", (*await rate_in_thread(maze), maze_id))
+		cursor = await self.db.execute("SELECT id, difficulty FROM mazes WHERE position IS NULL ORDER BY id")
+		for maze_id, difficulty in await cursor.fetchall():
+			await self.db.execute("UPDATE mazes SET position = (SELECT ifnull(max(position)+1, 0) FROM mazes WHERE difficulty = ?) WHERE id = ?", (difficulty, maze_id))
+		if os.path.exists(legacy_file):
+			with open(legacy_file, 'r') as f:
+				for line in f:
+					if line.strip():
+						maze = line.rstrip('\n').replace(r'\n', '\n') # levels.txt escaped the newlines
+						await self.add(maze, *await rate_in_thread(maze), commit=False)
+			os.replace(legacy_file, legacy_file+'.migrated')
+		await self.db.commit()
+
+	async def add(self, maze, min_moves, difficulty, commit=True):
+		"""Saves a maze, returns False if the same maze was already saved"""
+		cursor = await self.db.execute("INSERT OR IGNORE INTO mazes (hash, maze, min_moves, difficulty, position) VALUES (?,?,?,?,(SELECT ifnull(max(position)+1, 0) FROM mazes WHERE difficulty = ?))", (hashlib.sha1(maze.encode()).hexdigest(), maze, min_moves, difficulty, difficulty))
+		if commit:
+			await self.db.commit()
+		return cursor.rowcount == 1
+
+	async def count(self, difficulty=None):
+		"""The number of mazes (of a difficulty), the last id or position is read from the end of the index instead of counting the rows"""
+		if difficulty:
+			cursor = await self.db.execute("SELECT ifnull(max(position)+1, 0) FROM mazes WHERE difficulty = ?", (difficulty,))
+		else:
+			cursor = await self.db.execute("SELECT ifnull(max(id), 0) FROM mazes")
+		return (await cursor.fetchone())[0]
+
+	async def shuffled(self, difficulty=None, rng=random):
+		"""Yields the mazes in a random order, every maze is equally likely to come first
+
+		A Fisher-Yates shuffle of the positions (ids without a difficulty) that only swaps the ones it got to, so a game that plays k mazes does k index lookups
+		whatever the number of mazes. rng is the session's random.Random so the order can be played again"""
+		total = await self.count(difficulty)
+		swapped = {} # position -> the position that was swapped there
+		for index in range(total):
+			pick = rng.randrange(index, total)
+			position = swapped.get(pick, pick)
+			swapped[pick] = swapped.get(index, index)
+			if difficulty:
+				cursor = await self.db.execute("SELECT maze FROM mazes WHERE difficulty = ? AND position = ?", (difficulty, position))
+			else:
+				cursor = await self.db.execute("SELECT maze FROM mazes WHERE id = ?", (position+1,))
+			row = await cursor.fetchone()
+			if row: # not deleted since
+				yield row[0]